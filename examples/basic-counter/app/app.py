@@ -2,15 +2,16 @@ from pathlib import Path
 from fastapi import Request
 from brackets import App, get, post, page
 
-app = App(templates=str(Path(__file__).parent / 'templates'))
+app = App(templates=str(Path(__file__).parent / 'templates'), layout='layouts/@base.bx',
+          bx_compat=False)
 
 @get('/')
 def home(request: Request):
     n = int(request.session.get('n', 0))
-    return page('pages/index.bx', n=n, _app=app)
+    return page('pages/index.bx', n=n, _app=app, _request=request)
 
 @post('/inc')
 def increment(request: Request):
     n = int(request.session.get('n', 0)) + 1
     request.session['n'] = n
-    return page('pages/index.bx', n=n, _app=app)
+    return page('pages/index.bx', n=n, _app=app, _request=request)
@@ -1,7 +1,7 @@
 from pathlib import Path
 from brackets import App, get, page
 
-app = App(templates=str(Path(__file__).parent / 'templates'))
+app = App(templates=str(Path(__file__).parent / 'templates'), layout='layouts/@base.bx')
 
 @get('/')
 def home():
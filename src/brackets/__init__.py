@@ -1,14 +1,14 @@
 from .public import (
     App, page, json, get, post, put, delete, redirect, toast, reload,
-    cache, invalidate, useCache,
-    Model, Data, Id, CreatedAt, UpdatedAt, useDatabase, resource, crud,
+    cache, invalidate, useCache, broadcast, useSSE, useEvents, limit,
+    Model, Data, Id, CreatedAt, UpdatedAt, useDatabase, resource, crud, DB, AsyncDB,
     openWindow,
 )
 
 __all__ = [
     "App","page","json","get","post","put","delete","redirect","toast","reload",
-    "cache","invalidate","useCache",
-    "Model","Data","Id","CreatedAt","UpdatedAt","useDatabase","resource","crud",
+    "cache","invalidate","useCache","broadcast","useSSE","useEvents","limit",
+    "Model","Data","Id","CreatedAt","UpdatedAt","useDatabase","resource","crud","DB","AsyncDB",
     "openWindow",
 ]
 
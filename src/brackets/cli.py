@@ -1,5 +1,5 @@
 from __future__ import annotations
-import argparse, sys, os
+import argparse, json, sys, os
 from pathlib import Path
 import importlib, importlib.util, importlib.machinery
 
@@ -18,22 +18,24 @@ _CANDIDATE_OBJS  = ("app", "api", "application", "asgi")
 
 # ---------- config / target resolution ----------
 
-def _read_default_target(cwd: Path) -> str | None:
-    """Read defaultTarget from brx.toml (top-level or [brx])."""
+def _read_config(cwd: Path) -> dict:
+    """Read brx.toml; keys under [brx] override top-level ones."""
     p = cwd / "brx.toml"
     if not p.exists() or tomllib is None:
-        return None
+        return {}
     try:
         data = tomllib.loads(p.read_text(encoding="utf-8"))
-        if isinstance(data, dict):
-            if "defaultTarget" in data:
-                return str(data["defaultTarget"])
-            brx = data.get("brx")
-            if isinstance(brx, dict) and "defaultTarget" in brx:
-                return str(brx["defaultTarget"])
     except Exception:
-        pass
-    return None
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    brx = data.get("brx")
+    return {**data, **brx} if isinstance(brx, dict) else data
+
+def _read_default_target(cwd: Path) -> str | None:
+    """Read defaultTarget from brx.toml (top-level or [brx])."""
+    target = _read_config(cwd).get("defaultTarget")
+    return str(target) if target is not None else None
 
 def _resolve_target(arg: str | None, cwd: Path) -> str:
     """
@@ -85,31 +87,8 @@ def _load(target: str):
     # File path target: allow sibling imports with no __init__.py
     if mod_part.lower().endswith(".py") or mod_part.replace("\\", "/").lower().endswith(".py"):
         path = Path(mod_part).resolve()
-        if not path.exists():
-            raise SystemExit(f"[brx] File not found: {path}")
-        # Add the file's folder to sys.path so 'from models import X' works
-        if str(path.parent) not in sys.path:
-            sys.path.insert(0, str(path.parent))
-
-        spec = importlib.util.spec_from_loader(
-            path.stem, importlib.machinery.SourceFileLoader(path.stem, str(path))
-        )
-        if spec is None or spec.loader is None:
-            raise SystemExit(f"[brx] Could not load module from: {path}")
-
-        mod = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(mod)  # type: ignore[attr-defined]
-
-        if hasattr(mod, obj):
-            return getattr(mod, obj)
-        # Try alternates if user omitted or misnamed
-        for name in _CANDIDATE_OBJS:
-            if hasattr(mod, name):
-                return getattr(mod, name)
-        raise SystemExit(
-            f"[brx] '{obj}' not found in {path.name}. "
-            f"Tried: {obj}, {', '.join(_CANDIDATE_OBJS)}"
-        )
+        mod = _import_file(path)
+        return getattr(mod, _app_name(mod, obj, path.name))
 
     # Import string target
     mod = importlib.import_module(mod_part)
@@ -117,16 +96,157 @@ def _load(target: str):
         return getattr(mod, obj)
     raise SystemExit(f"[brx] '{obj}' not found in module {mod_part}")
 
-def _serve(target: str, mode: str = "dev", host: str = "127.0.0.1", port: int = 8000):
+def _import_file(path: Path):
+    """Import a .py file as the top-level module `path.stem`, with its folder on sys.path."""
+    if not path.exists():
+        raise SystemExit(f"[brx] File not found: {path}")
+    # Add the file's folder to sys.path so 'from models import X' works
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+
+    spec = importlib.util.spec_from_loader(
+        path.stem, importlib.machinery.SourceFileLoader(path.stem, str(path))
+    )
+    if spec is None or spec.loader is None:
+        raise SystemExit(f"[brx] Could not load module from: {path}")
+
+    mod = importlib.util.module_from_spec(spec)
+    # registered like a normal import, so a later 'import <stem>' (uvicorn) reuses it
+    sys.modules[path.stem] = mod
+    try:
+        spec.loader.exec_module(mod)  # type: ignore[attr-defined]
+    except BaseException:
+        sys.modules.pop(path.stem, None)
+        raise
+    return mod
+
+def _app_name(mod, obj: str, where: str) -> str:
+    """The named object; if the user omitted or misnamed it, the first candidate
+    that is a Brackets App, else the first candidate that exists."""
+    if hasattr(mod, obj):
+        return obj
+    from .internal.app import App
+    found = [name for name in _CANDIDATE_OBJS if hasattr(mod, name)]
+    if not found:
+        raise SystemExit(f"[brx] '{obj}' not found in {where}. Tried: {obj}, {', '.join(_CANDIDATE_OBJS)}")
+    return next((name for name in found if isinstance(getattr(mod, name), App)), found[0])
+
+def _import_string(target: str) -> tuple[str, str | None]:
+    """'file.py:obj' -> ('file:obj', file's folder) so uvicorn workers can import it.
+
+    The file is imported here to find the object the way _load does; uvicorn then
+    reuses the module from sys.modules instead of importing it a second time.
+    """
+    mod_part, obj = target.split(":", 1)
+    if not mod_part.replace("\\", "/").lower().endswith(".py"):
+        return target, None
+    path = Path(mod_part).resolve()
+    return f"{path.stem}:{_app_name(_import_file(path), obj, path.name)}", str(path.parent)
+
+# uvicorn options settable from the CLI or a [serve] table in brx.toml
+_SERVE_OPTS = {"workers": int, "loop": str, "http": str, "backlog": int, "timeout_keep_alive": int,
+               "timeout_graceful_shutdown": int, "limit_concurrency": int}
+
+def _serve_options(a, cwd: Path, mode: str) -> dict:
+    conf = _read_config(cwd).get("serve", {})
+    conf = conf if isinstance(conf, dict) else {}
+    opts = {}
+    for k, cast in _SERVE_OPTS.items():
+        v = getattr(a, k, None)
+        if v is None:
+            v = conf.get(k.replace("_", "-"), conf.get(k))
+        if v is not None:
+            opts[k] = cast(v)
+    if mode == "prod":
+        opts.setdefault("workers", os.cpu_count() or 1)
+    return opts
+
+def _serve(target: str, mode: str = "dev", host: str = "127.0.0.1", port: int = 8000, **opts):
     try:
         import uvicorn  # provided by brackets[speed]
     except Exception as e:
         raise SystemExit("[brx] uvicorn is required. Install with: pip install 'uvicorn[standard]'") from e
 
-    app = _load(target)
+    os.environ["BRX_MODE"] = mode
     log_level = "warning" if mode == "prod" else "info"
-    # We pass the app object directly; uvicorn 'reload' requires import strings.
-    uvicorn.run(app, host=host, port=port, log_level=log_level)
+    # An import string lets each uvicorn worker import the app itself; in prod
+    # every worker warms its template cache and DB pool before serving (App startup).
+    app, app_dir = _import_string(target)
+    if app_dir is None and importlib.util.find_spec(target.split(":", 1)[0]) is None:
+        raise SystemExit(f"[brx] Module not found: {target.split(':', 1)[0]}")  # fail here, not in every worker
+    uvicorn.run(app, host=host, port=port, log_level=log_level, app_dir=app_dir, **opts)
+
+def _build(target: str | None, templates: str | None, out: str, cwd: Path, compat: bool = True) -> int:
+    from .internal.render import build
+    if templates is None:
+        app = _load(_resolve_target(target, cwd))
+        env = getattr(app, "env", None)
+        if env is None:
+            raise SystemExit("[brx] Target has no .env; pass --templates DIR")
+        templates = env.templates_dir
+        compat = compat and getattr(env, "bx_compat", True)
+    if not Path(templates).is_dir():
+        raise SystemExit(f"[brx] Templates directory not found: {templates}")
+    names = build(str(templates), out, compat=compat)
+    print(f"[brx] Compiled {len(names)} template(s) from {templates} -> {out}")
+    return 0
+
+def _cache(a, cwd: Path) -> int:
+    from .internal import cache
+    mode = a.backend or str(_read_config(cwd).get("cache", "auto"))
+    if cache.useCache(mode) == "memory":
+        print("[brx] Note: the memory backend lives inside each server process; this CLI only sees its own.")
+    unreachable = (cache.redis.exceptions.ConnectionError, cache.redis.exceptions.TimeoutError) if cache.redis else ()
+    try:
+        if a.action in ("stats", "status"):
+            for k, v in cache.info().items():
+                print(f"{k}: {v}")
+        elif a.action == "keys":
+            for k, ttl in cache.keys(a.pattern, a.limit):
+                print(f"{k}\t{'-' if ttl is None else f'{ttl:.0f}s'}")
+        elif a.action == "invalidate":
+            if not a.tag and not a.key:
+                raise SystemExit("[brx] invalidate needs --tag and/or --key")
+            cache.invalidate(key=a.key, tags=a.tag)
+            what = ([f"key={a.key}"] if a.key else []) + [f"tag={t}" for t in a.tag or ()]
+            print(f"[brx] Invalidated {' '.join(what)}")
+    except unreachable as e:
+        raise SystemExit(f"[brx] Could not reach Redis for the '{mode}' cache backend ({e}). "
+                         f"Start Redis or pass --backend memory.")
+    return 0
+
+def _bench(a) -> int:
+    from .internal import bench
+    quick = a.quick
+    only = [g.strip() for g in a.only.split(",") if g.strip()] if a.only else None
+    unknown = sorted(set(only or ()) - set(bench.MICRO + bench.LOAD))
+    if unknown:
+        raise SystemExit(f"[brx] Unknown benchmark group(s): {', '.join(unknown)}. "
+                         f"Choose from {','.join(bench.MICRO + bench.LOAD)}")
+    report = bench.run(
+        only=only,
+        iterations=a.iterations or (200 if quick else 2000),
+        requests=a.requests or (100 if quick else 1000),
+        concurrency=a.concurrency, examples_dir=a.examples,
+    )
+    out = json.dumps(report, indent=2)
+    if a.out:
+        Path(a.out).write_text(out + "\n", encoding="utf-8")
+        print(f"[brx] Wrote {a.out}")
+    else:
+        print(out)
+    if a.compare:
+        try:
+            baseline = json.loads(Path(a.compare).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            raise SystemExit(f"[brx] Could not read baseline {a.compare}: {e}")
+        slower = bench.compare(report, baseline, a.tolerance)
+        for line in slower:
+            print(f"[brx] slower: {line}", file=sys.stderr)
+        if slower:
+            return 1
+        print(f"[brx] No regressions beyond {a.tolerance:.0%} against {a.compare}", file=sys.stderr)
+    return 0
 
 # ---------- CLI ----------
 
@@ -144,6 +264,38 @@ def main(argv: list[str] | None = None):
     srv.add_argument("target", nargs="?", help="Same resolution as 'dev'")
     srv.add_argument("--host", default="0.0.0.0")
     srv.add_argument("--port", default=8000, type=int)
+    srv.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    srv.add_argument("--loop", choices=["auto", "asyncio", "uvloop"], default=None)
+    srv.add_argument("--http", choices=["auto", "h11", "httptools"], default=None)
+    srv.add_argument("--backlog", type=int, default=None, help="Max queued connections")
+    srv.add_argument("--timeout-keep-alive", type=int, default=None, help="Seconds to hold idle keep-alive connections")
+    srv.add_argument("--timeout-graceful-shutdown", type=int, default=None, help="Seconds to let requests finish on shutdown")
+    srv.add_argument("--limit-concurrency", type=int, default=None, help="Max concurrent connections per worker (503 beyond)")
+
+    bld = sub.add_parser("build", help="Precompile .bx/.bxc templates for 'serve'")
+    bld.add_argument("target", nargs="?", help="Same resolution as 'dev'; used to find the templates dir")
+    bld.add_argument("--templates", default=None, help="Templates directory (skips loading the app)")
+    bld.add_argument("--out", default="build", help="Output directory (default: ./build)")
+    bld.add_argument("--no-bx-compat", action="store_true", help="Use the corrected .bx compiler (the app's bx_compat=False does the same)")
+
+    cch = sub.add_parser("cache", help="Inspect or invalidate the configured cache backend")
+    cch.add_argument("action", choices=["stats", "status", "keys", "invalidate"])
+    cch.add_argument("--backend", default=None, help="'memory', 'redis://...', 'tiered+redis://...' (default: brx.toml 'cache' or auto)")
+    cch.add_argument("--pattern", default="*", help="Glob for 'keys'")
+    cch.add_argument("--limit", default=100, type=int, help="Max keys to list")
+    cch.add_argument("--tag", action="append", help="Tag to invalidate (repeatable)")
+    cch.add_argument("--key", default=None, help="Key to invalidate")
+
+    bch = sub.add_parser("bench", help="Run micro-benchmarks and in-process load tests, report JSON")
+    bch.add_argument("--only", default=None, help="Comma-separated groups: dsl,render,cache,csrf,limit,sse,json,examples,crud")
+    bch.add_argument("--quick", action="store_true", help="Fewer iterations, for CI smoke runs")
+    bch.add_argument("--iterations", type=int, default=None, help="Calls per micro-benchmark (default: 2000)")
+    bch.add_argument("--requests", type=int, default=None, help="Requests per load test (default: 1000)")
+    bch.add_argument("--concurrency", type=int, default=10, help="Concurrent clients per load test")
+    bch.add_argument("--examples", default=None, help="Examples directory (default: ./examples)")
+    bch.add_argument("--out", default=None, help="Write the report here instead of stdout")
+    bch.add_argument("--compare", default=None, help="Baseline report; exit 1 if any p50 regressed")
+    bch.add_argument("--tolerance", type=float, default=0.10, help="Allowed p50 slowdown for --compare (default: 0.10)")
 
     a = p.parse_args(argv)
     cwd = Path(os.getcwd())
@@ -152,8 +304,15 @@ def main(argv: list[str] | None = None):
         _serve(_resolve_target(a.target, cwd), mode="dev", host=a.host, port=a.port)
         return 0
     if a.cmd == "serve":
-        _serve(_resolve_target(a.target, cwd), mode="prod", host=a.host, port=a.port)
+        _serve(_resolve_target(a.target, cwd), mode="prod", host=a.host, port=a.port,
+               **_serve_options(a, cwd, "prod"))
         return 0
+    if a.cmd == "build":
+        return _build(a.target, a.templates, a.out, cwd, compat=not a.no_bx_compat)
+    if a.cmd == "cache":
+        return _cache(a, cwd)
+    if a.cmd == "bench":
+        return _bench(a)
 
     p.print_help()
     return 1
@@ -1,6 +1,8 @@
 from __future__ import annotations
+import os
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
+from starlette.middleware import Middleware
 from starlette.middleware.sessions import SessionMiddleware
 from importlib.resources import files as pkg_files
 from .render import Env
@@ -8,19 +10,53 @@ from .router import mount_decorators
 from .security import CSRFMiddleware
 from .sse import mount_sse
 from .events import mount_events
+from .metrics import mount_metrics
+from .plugins import HandlerTimer, LifecycleMiddleware
+from . import data
 
 class App(FastAPI):
     """FastAPI with Brackets wiring: static, Jinja env, CSRF, sessions, SSE, events."""
-    def __init__(self, templates: str | None = None, *, secret: str = 'dev-secret', morph: bool = False):
+    def __init__(self, templates: str | None = None, *, secret: str = 'dev-secret', morph: bool = False,
+                 mode: str | None = None, build_dir: str | None = None, metrics: bool = False,
+                 layout: str | None = None, bx_compat: bool = True):
         super().__init__()
-        self.env = Env(templates_dir=templates)
+        self.layout = layout  # opt-in: wraps page() output on full loads; skipped for HTMX requests
+        # `brx serve` sets BRX_MODE=prod; prod loads templates from a `brx build` artifact when present.
+        self.mode = mode or os.environ.get('BRX_MODE', 'dev')
+        if self.mode == 'prod':
+            build_dir = build_dir or os.environ.get('BRX_BUILD_DIR')
+            if build_dir and not os.path.isdir(build_dir):
+                raise RuntimeError(f"build dir not found: {build_dir} (run 'brx build')")
+            if not build_dir and os.path.isdir(os.path.join(os.getcwd(), 'build', 'templates')):
+                build_dir = os.path.join(os.getcwd(), 'build')
+            self.env = Env(templates_dir=templates, auto_reload=False, build_dir=build_dir, bx_compat=bx_compat)
+        else:
+            # bx_compat=False opts in to the corrected .bx compiler (dsl.compile_bx)
+            self.env = Env(templates_dir=templates, bx_compat=bx_compat)
         static_dir = pkg_files('brackets').joinpath('static')
         self.mount('/static', StaticFiles(directory=str(static_dir)), name='static')
         self.add_middleware(SessionMiddleware, secret_key=secret)
         self.add_middleware(CSRFMiddleware)
+        # plugin hooks + phase timings: outermost and innermost of the stack
+        self.add_middleware(LifecycleMiddleware)
+        self.user_middleware.append(Middleware(HandlerTimer))
         mount_sse(self)
         mount_events(self)
+        if metrics:
+            mount_metrics(self)  # opt-in: /bx/metrics (Prometheus text), request histograms, Server-Timing
         mount_decorators(self)
+        # a startup handler rather than lifespan=, which would switch off @app.on_event handlers
+        self.router.add_event_handler('startup', self._warm_on_startup)
+
+    async def _warm_on_startup(self):
+        # prod workers (`brx serve`) warm up before uvicorn starts accepting connections
+        if self.mode == 'prod':
+            await self.warm()
+
+    async def warm(self):
+        """Load all templates into the cache and open the DB pool's connections."""
+        self.env.warm()
+        await data.warm()
 
     def render(self, template: str, **ctx):
         return self.env.render(template, **ctx)
@@ -0,0 +1,426 @@
+"""Micro-benchmarks and in-process load tests behind `brx bench`.
+
+Every benchmark returns latency percentiles and throughput; `run()` collects
+them into one JSON-serializable report that `compare()` can check against a
+previous run.
+"""
+from __future__ import annotations
+import asyncio, gc, os, platform, random, shutil, sys, tempfile, time
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Any, Callable
+
+_PAGE = '''<h1>{title}</h1>
+<p><Link to="/todos" prefetch>Open Todos</Link></p>
+<form action="/todos" onSubmit><input name="title"/><button type="submit">Add</button></form>
+<ul>
+  [for todos as t when not t.done]
+    <li id="todo-{t.id}"><Link to="/todos/{t.id}">{t.title}</Link>[between]<hr/>[/between]</li>
+  [empty]
+    <li class="muted">Nothing yet.</li>
+  [/for]
+</ul>
+'''
+_LAYOUT = '<!doctype html><html><head><title>{ title }</title></head><body><main id="app">{children}</main></body></html>'
+_ROWS = '<table>[for rows as r]<tr><td>{r.id}</td><td>{r.title}</td><td>{r.done}</td></tr>[/for]</table>'
+
+class _Row:
+    __slots__ = ('id', 'title', 'done')
+    def __init__(self, i: int):
+        self.id, self.title, self.done = i, f'todo number {i}', i % 3 == 0
+
+def _summary(samples_ns: list[int], wall_s: float | None = None) -> dict:
+    s = sorted(samples_ns)
+    n = len(s)
+    pct = lambda q: s[min(n - 1, int(q * n))] / 1000
+    wall = wall_s if wall_s is not None else sum(s) / 1e9
+    return {'n': n, 'ops_per_s': round(n / wall, 1) if wall else None,
+            'mean_us': round(sum(s) / n / 1000, 2), 'p50_us': round(pct(0.50), 2), 'p99_us': round(pct(0.99), 2)}
+
+def _measure(fn: Callable[[], Any], n: int, warmup: int = 50) -> dict:
+    for _ in range(min(warmup, n)):
+        fn()
+    samples = []
+    gc.collect(); gc.disable()
+    try:
+        for _ in range(n):
+            t0 = perf_counter_ns(); fn(); samples.append(perf_counter_ns() - t0)
+    finally:
+        gc.enable()
+    return _summary(samples)
+
+async def _ameasure(fn: Callable[[], Any], n: int, warmup: int = 50) -> dict:
+    for _ in range(min(warmup, n)):
+        await fn()
+    samples = []
+    gc.collect(); gc.disable()
+    try:
+        for _ in range(n):
+            t0 = perf_counter_ns(); await fn(); samples.append(perf_counter_ns() - t0)
+    finally:
+        gc.enable()
+    return _summary(samples)
+
+# ---------- micro-benchmarks ----------
+
+def _bench_dsl(n: int, repeats: tuple[int, ...] = (1, 8, 64, 512)) -> dict:
+    # the same page repeated k times: compile time should grow linearly with k
+    from math import log
+    from .dsl import compile_bx
+    out, sizes, p50s = {}, [], []
+    for k in repeats:
+        src = _PAGE * k
+        res = _measure(lambda: compile_bx(src), max(3, n // k), warmup=max(1, 50 // k))
+        out['dsl.compile_bx' if k == 1 else f'dsl.compile_bx_x{k}'] = res
+        sizes.append(len(src)); p50s.append(res['p50_us'])
+    # slope of log(time) over log(size): ~1.0 is linear, ~2.0 quadratic
+    exponent = log(p50s[-1] / p50s[0]) / log(sizes[-1] / sizes[0]) if len(sizes) > 1 else None
+    out['dsl.scaling'] = {'chars': sizes, 'p50_us': p50s,
+                          'exponent': round(exponent, 3) if exponent is not None else None}
+    out['dsl.compile_bx_fixed'] = _measure(lambda: compile_bx(_PAGE, compat=False), n)  # opt-in compiler
+    return out
+
+def _bench_render(n: int, tmp: Path) -> dict:
+    from .render import Env
+    (tmp / 'pages').mkdir(parents=True); (tmp / 'layouts').mkdir()
+    (tmp / 'pages' / 'index.bx').write_text(_PAGE, encoding='utf-8')
+    (tmp / 'pages' / 'rows.bx').write_text(_ROWS, encoding='utf-8')
+    (tmp / 'layouts' / '@base.bx').write_text(_LAYOUT, encoding='utf-8')
+    env = Env(str(tmp), auto_reload=False)
+    from markupsafe import Markup
+    todos = [_Row(i) for i in range(20)]
+    rows = [_Row(i) for i in range(5000)]
+    big = max(5, n // 100)
+    return {
+        'render.fragment': _measure(lambda: env.render('pages/index.bx', title='Todos', todos=todos), n),
+        'render.full_page': _measure(lambda: env.render(
+            'layouts/@base.bx', title='Todos',
+            children=Markup(env.render('pages/index.bx', title='Todos', todos=todos))), n),
+        'render.rows_5000': _measure(lambda: env.render('pages/rows.bx', rows=rows), big, warmup=2),
+        'render.rows_5000_stream': _measure(lambda: sum(1 for _ in env.stream('pages/rows.bx', rows=rows)), big, warmup=2),
+    }
+
+def _bench_cache(n: int) -> dict:
+    from . import cache as c
+    c.useCache('memory', max_entries=n * 2)
+    @c.cache(60, key='bench.hit')
+    def hit(): return {'ok': True}
+    @c.cache(60)
+    def miss(i): return i
+    args = iter(range(10 ** 9))
+    parts = ('users', 42, {'page': 2, 'sort': 'name'}, [1, 2, 3])
+    out = {
+        'cache.hit': _measure(hit, n),
+        'cache.miss': _measure(lambda: miss(next(args)), n),
+        'cache._make_key': _measure(lambda: c._make_key(None, miss, parts, {'q': 'x'}), n),
+    }
+    c._mem.clear()
+    return out
+
+def _bench_csrf(n: int) -> dict:
+    from .security import CSRFMiddleware, CSRF_COOKIE, CSRF_HEADER
+    async def ok(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+    mw = CSRFMiddleware(ok)
+    cookie = f'{CSRF_COOKIE}={mw.token}'.encode()
+    form = f'title=x&{CSRF_COOKIE}={mw.token}'.encode()
+    def scope(method, headers):
+        return {'type': 'http', 'method': method, 'path': '/', 'headers': headers}
+    async def receive(): return {'type': 'http.request', 'body': form, 'more_body': False}
+    async def send(_): pass
+    get = scope('GET', [])
+    post_header = scope('POST', [(b'cookie', cookie), (CSRF_HEADER.lower().encode(), mw.token.encode())])
+    post_form = scope('POST', [(b'cookie', cookie), (b'content-type', b'application/x-www-form-urlencoded')])
+    async def main():
+        return {
+            'csrf.get': await _ameasure(lambda: mw(dict(get), receive, send), n),
+            'csrf.post_header': await _ameasure(lambda: mw(dict(post_header), receive, send), n),
+            'csrf.post_form': await _ameasure(lambda: mw(dict(post_form), receive, send), n),
+        }
+    return asyncio.run(main())
+
+def _legacy_csrf_middleware():
+    """The BaseHTTPMiddleware CSRFMiddleware the pure-ASGI one replaced, kept as
+    the 'before' side of load.csrf.*."""
+    from fastapi import Request
+    from fastapi.responses import PlainTextResponse
+    from itsdangerous import URLSafeSerializer
+    from starlette.middleware.base import BaseHTTPMiddleware
+    from .security import CSRF_COOKIE, CSRF_FORM, CSRF_HEADER
+
+    class LegacyCSRFMiddleware(BaseHTTPMiddleware):
+        def __init__(self, app, *, secret: str = 'csrf-secret'):
+            super().__init__(app)
+            self.ser = URLSafeSerializer(secret, salt='brx.csrf')
+
+        async def dispatch(self, request: Request, call_next):
+            csrf = request.cookies.get(CSRF_COOKIE)
+            if not csrf:
+                csrf = self.ser.dumps('ok')
+                request.state._issue_csrf = csrf
+            if request.method in {'POST', 'PUT', 'PATCH', 'DELETE'}:
+                token = request.headers.get(CSRF_HEADER)
+                if token is None:
+                    try:
+                        token = (await request.form()).get(CSRF_FORM)
+                    except Exception:
+                        token = None
+                if not token or token != csrf:
+                    return PlainTextResponse('CSRF failed', status_code=403)
+            response = await call_next(request)
+            if getattr(request.state, '_issue_csrf', None):
+                response.set_cookie(CSRF_COOKIE, csrf, httponly=True, samesite='lax')
+            return response
+    return LegacyCSRFMiddleware
+
+def _bench_csrf_load(requests: int, concurrency: int) -> dict:
+    """req/s of a small app without CSRF middleware, with CSRFMiddleware, and
+    with the BaseHTTPMiddleware version it replaced."""
+    from fastapi import FastAPI, Form
+    from fastapi.responses import PlainTextResponse
+    from .security import CSRFMiddleware, CSRF_COOKIE, CSRF_HEADER
+    token = CSRFMiddleware(None).token
+    form = {'content-type': 'application/x-www-form-urlencoded', 'cookie': f'{CSRF_COOKIE}={token}'}
+    header = {**form, CSRF_HEADER: token}
+    out: dict[str, Any] = {}
+    for variant, mw in (('off', None), ('on', CSRFMiddleware), ('legacy', _legacy_csrf_middleware())):
+        app = FastAPI()
+        app.get('/')(lambda: PlainTextResponse('ok'))
+
+        @app.post('/')
+        async def post(title: str = Form(...)):
+            return PlainTextResponse(title)
+        if mw is not None:
+            app.add_middleware(mw)
+        # the endpoint parses the form itself, as a real handler would
+        body = f'title=x&{CSRF_COOKIE}={token}'
+        out[f'load.csrf.{variant}.get'] = asyncio.run(_load(app, requests, concurrency))
+        out[f'load.csrf.{variant}.post_header'] = asyncio.run(
+            _load(app, requests, concurrency, 'POST', '/', headers=header, content=body))
+        # the legacy middleware's request.form() leaves the endpoint without a body (422)
+        if variant != 'legacy':
+            out[f'load.csrf.{variant}.post_form'] = asyncio.run(
+                _load(app, requests, concurrency, 'POST', '/', headers=form, content=body))
+    return out
+
+def _bench_limit(n: int) -> dict:
+    from starlette.requests import Request
+    from starlette.responses import Response
+    from . import cache as c
+    from .limit import limit
+    c.useCache('memory')
+    @limit('1000000000/s')
+    def handler(): return None
+    clients = [Request({'type': 'http', 'headers': [], 'client': (f'10.0.{i // 256}.{i % 256}', 1)})
+               for i in range(1000)]
+    rnd = random.Random(0)
+    return {'limit.memory': _measure(lambda: handler(_brx_request=rnd.choice(clients), _brx_response=Response()), n)}
+
+def _bench_sse(n: int, subscribers: int = 10_000) -> dict:
+    from . import sse
+    async def main():
+        sse.useSSE(queue_size=max(16, n))
+        subs = [sse._subscribe('bench') for _ in range(subscribers)]
+        res = await _ameasure(lambda: sse.broadcast('bench', 'tick'), max(5, n // 100), warmup=2)
+        for ch, q in subs:
+            sse._unsubscribe('bench', ch, q)
+        sse._channels.pop('bench', None)
+        sse.useSSE()
+        return res
+    return {f'sse.broadcast_{subscribers}': asyncio.run(main())}
+
+_json_model = None
+
+def _bench_json(n: int) -> dict:
+    global _json_model
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from . import data
+    from .http import FastJSONResponse
+    if _json_model is None:
+        class BenchJsonTodo(data.Model, table=True):
+            id: int | None = data.Id()
+            title: str
+            done: bool = False
+            createdAt: datetime = data.CreatedAt()
+            updatedAt: datetime = data.UpdatedAt()
+        _json_model = BenchJsonTodo
+    t0 = datetime(2024, 1, 1)
+    todos = [_json_model(id=i, title=f'todo number {i}', done=i % 3 == 0,
+                         createdAt=t0 + timedelta(seconds=i), updatedAt=t0 + timedelta(seconds=i))
+             for i in range(10_000)]
+    runs = max(5, n // 100)
+    return {
+        'json.todos_10k': _measure(lambda: FastJSONResponse(todos), runs, warmup=2),
+        'json.todos_10k_jsonable_encoder': _measure(lambda: JSONResponse(jsonable_encoder(todos)), runs, warmup=2),
+    }
+
+# ---------- in-process load tests ----------
+
+async def _load(app, requests: int, concurrency: int, method: str = 'GET', path: str = '/',
+                headers: dict | None = None, json: Any = None, content: str | None = None) -> dict:
+    import httpx
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)  # a failing handler counts as a 500
+    samples: list[int] = []
+    status: dict[int, int] = {}
+    todo = iter(range(requests))
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        for _ in range(min(20, requests)):
+            await client.request(method, path, headers=headers, json=json, content=content)
+        async def worker():
+            for _ in todo:
+                t0 = perf_counter_ns()
+                r = await client.request(method, path, headers=headers, json=json, content=content)
+                samples.append(perf_counter_ns() - t0)
+                status[r.status_code] = status.get(r.status_code, 0) + 1
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    out = _summary(samples, wall)
+    out['req_per_s'] = out.pop('ops_per_s')
+    out['status'] = {str(k): v for k, v in sorted(status.items())}
+    return out
+
+def _bench_examples(examples_dir: Path, names: list[str], requests: int, concurrency: int) -> dict:
+    # Each example is loaded as if in its own process: the decorator registry is
+    # process-wide, so it is emptied for the import and restored afterwards.
+    # App() only mounts the @get/@post routes declared before it; the ones an
+    # example declares after it are mounted here, so the load hits its handlers.
+    from ..cli import _load as load_target
+    from .router import _REGISTRY
+    out = {}
+    for name in names:
+        target = examples_dir / name / 'app' / 'app.py'
+        if not target.exists():
+            continue
+        saved = list(_REGISTRY); _REGISTRY.clear()
+        try:
+            app = load_target(f'{target}:app')
+            mounted = {(getattr(r, 'path', None), m) for r in app.routes for m in getattr(r, 'methods', None) or ()}
+            for method, path, func in _REGISTRY:
+                if (path, method) not in mounted:
+                    app.add_api_route(path, func, methods=[method])
+        finally:
+            _REGISTRY[:] = saved
+        for label, headers in (('full', None), ('hx', {'HX-Request': 'true'})):
+            out[f'load.{name}.{label}'] = asyncio.run(_load(app, requests, concurrency, headers=headers))
+    return out
+
+_bench_model = None
+
+def _per_call_app(model) -> Any:
+    # resource() before the DB dependency: every Model call opens its own Session
+    from fastapi import Body, FastAPI
+    from .http import FastJSONResponse
+    app = FastAPI(default_response_class=FastJSONResponse)
+
+    @app.get('/todos/')
+    def list_items():
+        return FastJSONResponse(model.all())
+
+    @app.get('/todos/{id}')
+    def read(id: int):
+        return FastJSONResponse(model.find(None, id))
+
+    @app.post('/todos/')
+    def create(payload: dict = Body(...)):
+        return FastJSONResponse(model.add(None, payload))
+
+    return app
+
+def _bench_crud(requests: int, concurrency: int, tmp: Path) -> dict:
+    """resource() with a per-request session on a tuned engine (useDatabase: WAL,
+    synchronous=NORMAL), against per-call sessions on a plain create_engine(),
+    each on its own SQLite file."""
+    global _bench_model
+    from fastapi import FastAPI
+    from sqlalchemy import create_engine
+    from sqlmodel import SQLModel
+    from . import data
+    if _bench_model is None:
+        class BenchTodo(data.Model, table=True):
+            id: int | None = data.Id()
+            title: str
+            done: bool = False
+        _bench_model = BenchTodo
+    model = _bench_model
+    ops = (('list_100', 'GET', '/todos/', None), ('read', 'GET', '/todos/1', None),
+           ('create', 'POST', '/todos/', {'title': 'new'}))
+    out: dict[str, Any] = {}
+    for variant in ('crud', 'crud_per_call'):
+        dsn = f'sqlite:///{tmp / (variant + ".db")}'
+        if variant == 'crud':
+            data.useDatabase(dsn)
+            app = FastAPI(); app.include_router(data.resource('/todos', model=model))
+        else:
+            data._engine = create_engine(dsn); data._async = False
+            SQLModel.metadata.create_all(data._engine)
+            app = _per_call_app(model)
+        for i in range(100):
+            model.add(None, {'title': f'todo {i}'})
+        for op, method, path, body in ops:
+            # creates grow the table, so they run last and list_100 stays at 100 rows
+            out[f'load.{variant}.{op}'] = asyncio.run(_load(app, requests, concurrency, method, path, json=body))
+        data._engine.dispose()
+    out['crud.speedup'] = {op: round(out[f'load.crud.{op}']['req_per_s'] / out[f'load.crud_per_call.{op}']['req_per_s'], 2)
+                           for op, *_ in ops}
+    return out
+
+# ---------- suite ----------
+
+MICRO = ('dsl', 'render', 'cache', 'csrf', 'limit', 'sse', 'json')
+LOAD = ('examples', 'crud')
+
+def run(*, only: list[str] | None = None, iterations: int = 2000, requests: int = 500,
+        concurrency: int = 10, examples_dir: str | None = None,
+        examples: tuple[str, ...] = ('minimal', 'basic-counter', 'todos')) -> dict:
+    """Run the selected groups (default: all) and return the report."""
+    from .. import __version__
+    groups = only or [*MICRO, *LOAD]
+    results: dict[str, Any] = {}
+    tmp = Path(tempfile.mkdtemp(prefix='brx-bench-'))
+    cwd = os.getcwd()
+    random.seed(0)
+    try:
+        os.chdir(tmp)  # examples create their sqlite files in the cwd
+        for g in groups:
+            if g == 'dsl': results.update(_bench_dsl(iterations))
+            elif g == 'render': results.update(_bench_render(iterations, tmp / 'tpl'))
+            elif g == 'cache': results.update(_bench_cache(iterations))
+            elif g == 'csrf':
+                results.update(_bench_csrf(iterations))
+                results.update(_bench_csrf_load(requests, concurrency))
+            elif g == 'limit': results.update(_bench_limit(iterations))
+            elif g == 'sse': results.update(_bench_sse(iterations))
+            elif g == 'json': results.update(_bench_json(iterations))
+            elif g == 'examples':
+                d = Path(examples_dir) if examples_dir else Path(cwd) / 'examples'
+                results.update(_bench_examples(d.resolve(), list(examples), requests, concurrency))
+            elif g == 'crud': results.update(_bench_crud(requests, concurrency, tmp))
+            else:
+                raise RuntimeError(f"unknown benchmark group: {g!r} (choose from {', '.join(MICRO + LOAD)})")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        'meta': {'brackets': __version__, 'python': platform.python_version(),
+                 'implementation': sys.implementation.name, 'platform': platform.platform(),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'iterations': iterations,
+                 'requests': requests, 'concurrency': concurrency},
+        'results': results,
+    }
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.10) -> list[str]:
+    """Benchmarks whose p50 got more than `tolerance` slower than in `baseline`."""
+    slower = []
+    for name, cur in report['results'].items():
+        old = baseline.get('results', {}).get(name)
+        key = 'p50_us'
+        if not old or not old.get(key) or key not in cur:
+            continue
+        ratio = cur[key] / old[key]
+        if ratio > 1 + tolerance:
+            slower.append(f'{name}: p50 {old[key]}us -> {cur[key]}us (+{(ratio - 1) * 100:.0f}%)')
+    return slower
@@ -1,112 +1,749 @@
 from __future__ import annotations
-import time, hashlib, threading
+import asyncio, fnmatch, functools, inspect, json, os, struct, time, hashlib, sys, threading, uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Any, Optional, Dict, Tuple, List
+from pydantic import BaseModel
+from sqlalchemy.orm import Session as _DBSession
+from starlette.background import BackgroundTasks
+from starlette.requests import HTTPConnection
+from starlette.responses import Response
+from .plugins import _emit
 
 try:
     import redis  # type: ignore
+    import redis.asyncio as aredis  # type: ignore
 except Exception:
     redis = None
+    aredis = None
+
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession as _AsyncDBSession
+except Exception:  # asyncio extra not installed
+    _AsyncDBSession = None
+
+class _MemoryStore:
+    """Bounded in-process store: LRU eviction by entry count and (approximate) bytes,
+    lazy expiry on read plus a periodic sweep on write, tag index kept in sync."""
+    def __init__(self, max_entries: Optional[int] = 10_000, max_bytes: Optional[int] = None,
+                 sweep_interval: float = 60.0):
+        self.max_entries, self.max_bytes, self.sweep_interval = max_entries, max_bytes, sweep_interval
+        # key -> (expires_at, value, drop_at, size); drop_at = expires_at + stale window
+        self._data: OrderedDict[str, Tuple[float, Any, float, int]] = OrderedDict()
+        self._tags: Dict[str, set[str]] = {}
+        self._key_tags: Dict[str, set[str]] = {}
+        self._bytes = 0
+        self._next_sweep = 0.0
+        self.evictions = 0
+
+    def __len__(self): return len(self._data)
+
+    def get(self, key: str, now: float):
+        item = self._data.get(key)
+        if item is None: return None, None
+        if item[2] <= now:
+            self._drop(key)
+            return None, None
+        self._data.move_to_end(key)
+        return item[0], item[1]
+
+    def set(self, key: str, value: Any, exp: float, drop_at: float, tags: Optional[List[str]], now: float):
+        if key in self._data: self._drop(key)
+        size = sys.getsizeof(value)
+        self._data[key] = (exp, value, drop_at, size)
+        self._bytes += size
+        if tags:
+            self._key_tags[key] = set(tags)
+            for t in tags:
+                self._tags.setdefault(t, set()).add(key)
+        if now >= self._next_sweep:
+            self.sweep(now)
+        self._evict()
+
+    def delete(self, key: str):
+        if key in self._data: self._drop(key)
+
+    def delete_tag(self, tag: str):
+        for k in list(self._tags.get(tag, ())):
+            self._drop(k)
+        self._tags.pop(tag, None)
+
+    def sweep(self, now: float):
+        for k in [k for k, item in self._data.items() if item[2] <= now]:
+            self._drop(k)
+        self._next_sweep = now + self.sweep_interval
+
+    def clear(self):
+        self._data.clear(); self._tags.clear(); self._key_tags.clear()
+        self._bytes = 0
+
+    def resize(self, max_entries: Optional[int], max_bytes: Optional[int]):
+        self.max_entries, self.max_bytes = max_entries, max_bytes
+        self._evict()
+
+    def _evict(self):
+        while self._data and ((self.max_entries is not None and len(self._data) > self.max_entries)
+                              or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            self._drop(next(iter(self._data)))
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        item = self._data.pop(key)
+        self._bytes -= item[3]
+        for t in self._key_tags.pop(key, ()):
+            members = self._tags.get(t)
+            if members is not None:
+                members.discard(key)
+                if not members: del self._tags[t]
 
 _backend = {"mode": "auto", "client": None}
-_mem_store: Dict[str, Tuple[float, Any]] = {}
-_tag_index: Dict[str, set[str]] = {}
+_mem = _MemoryStore()
 _lock = threading.RLock()
+_refreshing: set[str] = set()
+_refresh_pool: Optional[ThreadPoolExecutor] = None
+_inflight: Dict[str, "_Flight"] = {}
+_ainflight: Dict[str, asyncio.Future] = {}
+_tasks: set = set()  # strong refs to background refresh tasks
+_stats = {"coalesced": 0}
+# per key prefix / per tag: {"hit", "miss", "stale", "compute", "compute_seconds"}
+_metrics: Dict[str, Dict[str, Dict[str, float]]] = {"prefix": {}, "tag": {}}
+_METRIC_FIELDS = ("hit", "miss", "stale", "compute", "compute_seconds")
+
+_INVALIDATE_CHANNEL = "brx:invalidate"
+_TAG_BATCH = 500
+
+# Redis values are one string per key: format byte + expires_at (double) + serialized payload,
+# so a read is a single GET and expiry travels with the value.
+_HEADER = struct.Struct(">cd")
+_FORMAT = b"\x01"
+
+# Tag sets are sorted sets scored by each member's drop time (+inf = never), so dead
+# members get pruned and the set itself expires with its longest-lived member.
+# KEYS[1] tag set; ARGV: member, drop time (0 = never), now
+_TAG_ADD_LUA = """
+if redis.call('TYPE', KEYS[1]).ok == 'set' then redis.call('DEL', KEYS[1]) end
+local at = tonumber(ARGV[2])
+redis.call('ZADD', KEYS[1], at > 0 and at or '+inf', ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[3])
+local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')[2]
+if last == 'inf' then redis.call('PERSIST', KEYS[1])
+else redis.call('EXPIREAT', KEYS[1], math.ceil(tonumber(last))) end
+"""
+
+# deletes one batch of tag members and their keys atomically; every key it touches
+# comes in through KEYS (KEYS[1] tag set, KEYS[2..] the value keys of the ARGV members)
+_DROP_TAG_LUA = """
+for i = 2, #KEYS do redis.call('DEL', KEYS[i]) end
+redis.call('ZREM', KEYS[1], unpack(ARGV))
+return #ARGV
+"""
+_listener = {"pid": None}
+
+# compare-and-delete so a holder whose lock already expired can't drop someone else's
+_UNLOCK_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+class _JSONSerializer:
+    """Default Redis serializer. JSON only, so whoever can write to Redis can't
+    make the app run code when it reads a value back (unlike pickle)."""
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        try:
+            if orjson is not None:
+                return orjson.dumps(value)
+            return json.dumps(value, separators=(",", ":"), allow_nan=False).encode()
+        except (TypeError, ValueError) as e:
+            raise TypeError(f"cached value is not JSON-serializable ({e}); return plain data, or pass "
+                            "useCache(url, serializer=pickle) if every writer to this Redis is trusted") from None
+
+    @staticmethod
+    def loads(raw: bytes) -> Any:
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
 
-def useCache(mode: str):
+def useCache(mode: str, *, max_entries: Optional[int] = 10_000, max_bytes: Optional[int] = None,
+             l1_entries: int = 1_000, l1_ttl: float = 5.0, serializer: Any = _JSONSerializer):
+    """Select the cache backend: 'auto', 'memory', a redis:// URL, or 'tiered'.
+
+    `max_entries`/`max_bytes` bound the in-memory store (least recently used
+    entries are evicted first); `None` means unbounded.
+
+    'tiered' (or 'tiered+redis://...') puts a small per-process L1 of
+    `l1_entries` in front of Redis. L1 entries live at most `l1_ttl` seconds
+    and invalidate() evicts them in every worker via Redis pub/sub.
+
+    Redis values are encoded with `serializer` (anything with dumps/loads).
+    The default is JSON; pass `serializer=pickle` to store arbitrary Python
+    objects, but only when every client that can write to the Redis is trusted.
+    """
     global _backend
+    with _lock:
+        _mem.resize(max_entries, max_bytes)
     if mode == "auto":
         if redis is not None:
-            _backend = {"mode": "redis", "client": redis.Redis.from_url("redis://127.0.0.1:6379/0")}
+            _backend = _redis_backend("redis://127.0.0.1:6379/0", serializer)
         else:
             _backend = {"mode": "memory", "client": None}
     elif mode.startswith("redis://"):
         if redis is None:
             raise RuntimeError("redis extra not installed; pip install brackets[cache]")
-        _backend = {"mode": "redis", "client": redis.Redis.from_url(mode)}
+        _backend = _redis_backend(mode, serializer)
+    elif mode == "tiered" or mode.startswith("tiered+"):
+        if redis is None:
+            raise RuntimeError("redis extra not installed; pip install brackets[cache]")
+        _backend = _redis_backend(mode.partition("+")[2] or "redis://127.0.0.1:6379/0", serializer)
+        _backend["l1"] = _MemoryStore(max_entries=l1_entries)
+        _backend["l1_ttl"] = l1_ttl
+        _listener["pid"] = None
+        _ensure_listener()
+        return "tiered"
     else:
         _backend = {"mode": "memory", "client": None}
     return _backend["mode"]
 
+def _ensure_listener():
+    """Start this process's pub/sub thread that drops invalidated keys from L1 (once per pid)."""
+    if _listener["pid"] == os.getpid(): return
+    with _lock:
+        if _listener["pid"] == os.getpid(): return
+        _listener["pid"] = os.getpid()
+        backend = _backend
+    threading.Thread(target=_listen, args=(backend,), name="brx-cache-l1", daemon=True).start()
+
+def _listen(backend: dict):
+    l1 = backend["l1"]
+    while _backend is backend:
+        try:
+            pubsub = backend["client"].pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_INVALIDATE_CHANNEL)
+            # messages may have been missed while (re)connecting
+            with _lock: l1.clear()
+            for msg in pubsub.listen():
+                if _backend is not backend: break
+                data = json.loads(msg["data"])
+                with _lock:
+                    if data.get("all"):
+                        l1.clear()
+                    for k in data.get("keys", ()):
+                        l1.delete(k)
+        except Exception:
+            time.sleep(1.0)
+
+def _redis_backend(url: str, serializer: Any = _JSONSerializer) -> dict:
+    # async routes use the redis.asyncio client so they never block the event loop
+    cli, acli = redis.Redis.from_url(url), aredis.Redis.from_url(url)
+    return {
+        "mode": "redis", "client": cli, "aclient": acli, "serializer": serializer,
+        "unlock": cli.register_script(_UNLOCK_LUA), "aunlock": acli.register_script(_UNLOCK_LUA),
+        "tag_add": cli.register_script(_TAG_ADD_LUA), "atag_add": acli.register_script(_TAG_ADD_LUA),
+        "drop_tag": cli.register_script(_DROP_TAG_LUA),
+    }
+
+def _pack(value: Any, exp: float) -> bytes:
+    return _HEADER.pack(_FORMAT, exp) + _backend["serializer"].dumps(value)
+
+def _unpack(raw: Optional[bytes]):
+    # anything we can't decode (old layout, other serializer) reads as a miss
+    if raw is None or raw[:1] != _FORMAT or len(raw) < _HEADER.size:
+        return None, None
+    try:
+        return _HEADER.unpack_from(raw)[1], _backend["serializer"].loads(raw[_HEADER.size:])
+    except Exception:
+        return None, None
+
 def _now(): return time.time()
 
-def _make_key(route_key: Optional[str], fn: Callable, args: tuple, kwargs: dict) -> str:
-    if route_key:
-        return route_key
-    raw = (fn.__module__, fn.__qualname__, args, tuple(sorted(kwargs.items())))
-    return hashlib.sha256(repr(raw).encode()).hexdigest()
+# Framework/DI objects never belong in a key: per-request state is selected with vary=[...]
+_SKIP_KEY_TYPES = tuple(t for t in (HTTPConnection, Response, BackgroundTasks, _DBSession, _AsyncDBSession) if t)
+_VARY_SOURCES = ("query", "header", "cookie", "path", "session")
+
+_PLAIN_TYPES = frozenset({str, int, float, bool, bytes, type(None)})
+
+class _Unkeyable(Exception):
+    """An argument has no stable text for the key; the call skips the cache."""
+
+def _key_part(v: Any) -> Optional[str]:
+    """Stable text for one argument, or None for the framework objects in _SKIP_KEY_TYPES.
+
+    Raises _Unkeyable when the repr is an address (`<User object at 0x...>`):
+    leaving it out would give every such argument the same key.
+    """
+    t = type(v)
+    if t in _PLAIN_TYPES:
+        return repr(v)
+    if t is list or t is tuple or t is dict:
+        r = repr(v)  # C-speed for plain containers; fall back only if something inside has an address repr
+        if " at 0x" not in r:
+            return r
+    if isinstance(v, _SKIP_KEY_TYPES):
+        return None
+    if isinstance(v, (list, tuple)):
+        return "[" + ",".join(_key_part(x) or "-" for x in v) + "]"
+    if isinstance(v, dict):
+        return "{" + ",".join(sorted(f"{_key_part(k)}:{_key_part(x)}" for k, x in v.items())) + "}"
+    if isinstance(v, (set, frozenset)):
+        # set iteration order depends on hash seeds, which differ between workers
+        return "{" + ",".join(sorted(_key_part(x) or "-" for x in v)) + "}"
+    if isinstance(v, BaseModel):
+        return v.model_dump_json()
+    r = repr(v)
+    if " at 0x" in r:
+        raise _Unkeyable(t.__qualname__)
+    return r
+
+def _compile_vary(vary: Optional[List[str]]) -> List[Tuple[str, str]]:
+    """'query.page' / 'header.accept-language' / 'cookie.x' / 'path.id' / 'session.user'."""
+    out = []
+    for sel in vary or ():
+        src, _, name = sel.partition(".")
+        if src not in _VARY_SOURCES or not name:
+            raise ValueError(f"cache(vary=...): unknown selector {sel!r}; use one of "
+                             + ", ".join(f"{s}.<name>" for s in _VARY_SOURCES))
+        out.append((src, name.lower() if src == "header" else name))
+    return out
+
+def _vary_part(vary: List[Tuple[str, str]], args: tuple, kwargs: dict) -> str:
+    request = next((a for a in (*args, *kwargs.values()) if isinstance(a, HTTPConnection)), None)
+    if request is None:
+        raise RuntimeError("cache(vary=...) needs the handler to take a `request: Request` argument")
+    parts = []
+    for src, name in vary:
+        if src == "query": v = request.query_params.get(name)
+        elif src == "header": v = request.headers.get(name)
+        elif src == "cookie": v = request.cookies.get(name)
+        elif src == "path": v = request.path_params.get(name)
+        else: v = request.scope.get("session", {}).get(name)
+        parts.append(_key_part(v) or "-")
+    return "\x1f".join(parts)
+
+def _make_key(route_key: Optional[str], fn: Callable, args: tuple, kwargs: dict,
+              vary: Optional[List[Tuple[str, str]]] = None) -> str:
+    """`route_key` or `module.qualname`, plus a blake2b digest of the args and vary values."""
+    base = route_key or f"{fn.__module__}.{fn.__qualname__}"
+    parts = []
+    if not route_key:
+        if args:
+            parts.append(",".join(_key_part(a) or "-" for a in args))
+        kw = ",".join(f"{k}={p}" for k, p in sorted((k, _key_part(v)) for k, v in kwargs.items())
+                      if p is not None)
+        if kw:
+            parts.append(kw)
+    if vary:
+        parts.append(_vary_part(vary, args, kwargs))
+    if not parts:
+        return base
+    return base + ":" + hashlib.blake2b("\x1e".join(parts).encode(), digest_size=16).hexdigest()
+
+def _l1_get(key: str):
+    # L1 only ever holds fresh entries (dropped at min(expiry, l1_ttl)), so a hit is final
+    l1 = _backend.get("l1")
+    if l1 is None: return None, None
+    _ensure_listener()
+    with _lock:
+        return l1.get(key, _now())
+
+def _l1_put(key: str, value: Any, exp: float):
+    l1 = _backend.get("l1")
+    if l1 is None: return
+    now = _now()
+    if exp > now:
+        with _lock:
+            l1.set(key, value, exp, min(exp, now + _backend["l1_ttl"]), None, now)
 
 def _get(key: str):
     if _backend["mode"] == "redis" and _backend["client"] is not None:
-        v = _backend["client"].get(f"brx:{key}")
-        if v is None: return None, None
-        ts = float(_backend["client"].get(f"brx:{key}:ts") or b"0")
+        ts, v = _l1_get(key)
+        if ts is not None: return ts, v
+        ts, v = _unpack(_backend["client"].get(f"brx:{key}"))
+        if ts is not None: _l1_put(key, v, ts)
         return ts, v
     with _lock:
-        item = _mem_store.get(key)
-        if not item: return None, None
-        return item
+        return _mem.get(key, _now())
+
+async def _aget(key: str):
+    acli = _backend.get("aclient")
+    if _backend["mode"] == "redis" and acli is not None:
+        ts, v = _l1_get(key)
+        if ts is not None: return ts, v
+        ts, v = _unpack(await acli.get(f"brx:{key}"))
+        if ts is not None: _l1_put(key, v, ts)
+        return ts, v
+    return _get(key)
 
-def _set(key: str, value: Any, ttl: int, tags: Optional[List[str]]):
-    exp = _now() + ttl if ttl > 0 else float("inf")
+def _queue_set(pipe, tag_add, key: str, value: Any, exp: float, ttl: int, tags: Optional[List[str]], stale: int):
+    # shared by the sync and asyncio pipelines; commands are only buffered here
+    # keep expired values around for the stale window
+    pipe.set(f"brx:{key}", _pack(value, exp), ex=(ttl + stale) if ttl > 0 else None)
+    if tags:
+        pipe.scripts.add(tag_add)  # loaded by execute() if the server doesn't know it
+        drop_at = exp + stale if ttl > 0 else 0
+        for t in tags:
+            pipe.evalsha(tag_add.sha, 1, f"brx:tag:{t}", key, drop_at, _now())
+
+def _set(key: str, value: Any, ttl: int, tags: Optional[List[str]], stale: int = 0):
+    now = _now()
+    exp = now + ttl if ttl > 0 else float("inf")
     if _backend["mode"] == "redis" and _backend["client"] is not None:
-        cli = _backend["client"]
-        pipe = cli.pipeline()
-        pipe.set(f"brx:{key}", value)
-        pipe.set(f"brx:{key}:ts", exp)
-        if ttl > 0: pipe.expire(f"brx:{key}", ttl); pipe.expire(f"brx:{key}:ts", ttl)
-        if tags:
-            for t in tags:
-                pipe.sadd(f"brx:tag:{t}", key)
+        pipe = _backend["client"].pipeline()
+        _queue_set(pipe, _backend["tag_add"], key, value, exp, ttl, tags, stale)
         pipe.execute()
+        _l1_put(key, value, exp)
     else:
         with _lock:
-            _mem_store[key] = (exp, value)
-            if tags:
-                for t in tags:
-                    _tag_index.setdefault(t, set()).add(key)
+            _mem.set(key, value, exp, exp + stale, tags, now)
+
+async def _aset(key: str, value: Any, ttl: int, tags: Optional[List[str]], stale: int = 0):
+    acli = _backend.get("aclient")
+    if _backend["mode"] == "redis" and acli is not None:
+        exp = _now() + ttl if ttl > 0 else float("inf")
+        pipe = acli.pipeline()
+        _queue_set(pipe, _backend["atag_add"], key, value, exp, ttl, tags, stale)
+        await pipe.execute()
+        _l1_put(key, value, exp)
+    else:
+        _set(key, value, ttl, tags, stale)
 
 def invalidate(*, key: Optional[str] = None, tags: Optional[List[str]] = None):
     if _backend["mode"] == "redis" and _backend["client"] is not None:
         cli = _backend["client"]
+        dropped = [key] if key else []
         if key:
-            cli.delete(f"brx:{key}", f"brx:{key}:ts")
-        if tags:
-            for t in tags:
-                members = cli.smembers(f"brx:tag:{t}")
-                if members:
-                    cli.delete(*[f"brx:{m.decode()}" for m in members])
-                    cli.delete(*[f"brx:{m.decode()}:ts" for m in members])
-                cli.delete(f"brx:tag:{t}")
+            cli.delete(f"brx:{key}")
+        for t in tags or ():
+            tkey = f"brx:tag:{t}"
+            while True:
+                batch = [m.decode() for m in cli.zrange(tkey, 0, _TAG_BATCH - 1)]
+                if not batch: break
+                _backend["drop_tag"](keys=[tkey, *(f"brx:{m}" for m in batch)], args=batch)
+                dropped += batch
+                if len(batch) < _TAG_BATCH: break
+        l1 = _backend.get("l1")
+        if l1 is not None and dropped:
+            # L1 entries don't carry tags, so other workers get the resolved key list
+            with _lock:
+                for k in dropped: l1.delete(k)
+            cli.publish(_INVALIDATE_CHANNEL, json.dumps({"keys": dropped}))
     else:
         with _lock:
-            if key and key in _mem_store: _mem_store.pop(key, None)
+            if key: _mem.delete(key)
             if tags:
                 for t in tags:
-                    for k in list(_tag_index.get(t, set())):
-                        _mem_store.pop(k, None)
-                    _tag_index.pop(t, None)
+                    _mem.delete_tag(t)
+
+def _refresh(k: str, fn: Callable, args: tuple, kwargs: dict, seconds: int,
+             tags: Optional[List[str]], stale: int):
+    """Recompute `k` on the refresh pool; at most one refresh per key at a time."""
+    global _refresh_pool
+    with _lock:
+        if k in _refreshing: return
+        _refreshing.add(k)
+        if _refresh_pool is None:
+            _refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="brx-cache")
+    def run():
+        try:
+            _set(k, fn(*args, **kwargs), seconds, tags, stale)
+        except Exception:
+            pass  # keep serving the stale value; callers past the window recompute
+        finally:
+            with _lock:
+                _refreshing.discard(k)
+    _refresh_pool.submit(run)
+
+def _arefresh(k: str, fn: Callable, args: tuple, kwargs: dict, seconds: int,
+              tags: Optional[List[str]], stale: int):
+    """Async counterpart of _refresh: recompute `k` in a task on the running loop."""
+    with _lock:
+        if k in _refreshing: return
+        _refreshing.add(k)
+    async def run():
+        try:
+            await _aset(k, await fn(*args, **kwargs), seconds, tags, stale)
+        except Exception:
+            pass
+        finally:
+            with _lock:
+                _refreshing.discard(k)
+    task = asyncio.get_running_loop().create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats)
+
+def metrics() -> dict:
+    """Snapshot of the per-prefix / per-tag counters collected by @cache."""
+    with _lock:
+        return {scope: {name: dict(m) for name, m in by.items()} for scope, by in _metrics.items()}
+
+def _key_prefix(key: Optional[str], fn: Callable) -> str:
+    # 'user:{id}' -> 'user'; auto keys -> 'module.qualname'
+    if key:
+        return key.split(":", 1)[0].split("{", 1)[0] or key
+    return f"{fn.__module__}.{fn.__qualname__}"
+
+def _record(k: str, prefix: str, tags: Optional[List[str]], event: str, seconds: Optional[float] = None):
+    with _lock:
+        for scope, name in (("prefix", prefix), *(("tag", t) for t in tags or ())):
+            by = _metrics[scope]
+            m = by.get(name)
+            if m is None:
+                m = by[name] = dict.fromkeys(_METRIC_FIELDS, 0)
+            m[event] += 1
+            if seconds is not None:
+                m["compute_seconds"] += seconds
+    _emit("onCache", event, k, prefix=prefix, tags=tags, seconds=seconds)
+
+def _timed(fn: Callable, k: str, prefix: str, tags: Optional[List[str]]) -> Callable:
+    def call(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _record(k, prefix, tags, "compute", time.perf_counter() - t0)
+    return call
+
+def _atimed(fn: Callable, k: str, prefix: str, tags: Optional[List[str]]) -> Callable:
+    async def call(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _record(k, prefix, tags, "compute", time.perf_counter() - t0)
+    return call
+
+def info() -> dict:
+    """Backend-level numbers for `brx cache stats`."""
+    out: Dict[str, Any] = {"mode": "tiered" if _backend.get("l1") is not None else _backend["mode"], **stats()}
+    cli = _backend["client"] if _backend["mode"] == "redis" else None
+    if cli is None:
+        with _lock:
+            out.update(entries=len(_mem), tags=len(_mem._tags), bytes=_mem._bytes, evictions=_mem.evictions)
+        return out
+    mem, st = cli.info("memory"), cli.info("stats")
+    out.update(entries=sum(1 for _ in _iter_redis_keys(cli, "*")),
+               tags=sum(1 for _ in cli.scan_iter(match="brx:tag:*", count=1000)),
+               used_memory=mem.get("used_memory_human"),
+               keyspace_hits=st.get("keyspace_hits"), keyspace_misses=st.get("keyspace_misses"))
+    return out
+
+def _iter_redis_keys(cli, pattern: str):
+    for raw in cli.scan_iter(match=f"brx:{pattern}", count=1000):
+        k = raw.decode()[4:]
+        if not k.startswith(("tag:", "lock:")):
+            yield k
+
+def keys(pattern: str = "*", limit: int = 100) -> List[Tuple[str, Optional[float]]]:
+    """Up to `limit` cached keys matching a glob `pattern`, with seconds left until expiry."""
+    out: List[Tuple[str, Optional[float]]] = []
+    cli = _backend["client"] if _backend["mode"] == "redis" else None
+    if cli is None:
+        now = _now()
+        with _lock:
+            for k, item in _mem._data.items():
+                if len(out) >= limit: break
+                if fnmatch.fnmatchcase(k, pattern):
+                    out.append((k, None if item[0] == float("inf") else item[0] - now))
+        return out
+    for k in _iter_redis_keys(cli, pattern):
+        if len(out) >= limit: break
+        ttl = cli.ttl(f"brx:{k}")
+        out.append((k, None if ttl < 0 else float(ttl)))
+    return out
+
+def _compute_locked(k: str, fn: Callable, args: tuple, kwargs: dict, seconds: int,
+                    tags: Optional[List[str]], stale: int, wait: float):
+    """Compute and store `k`; in Redis mode only one worker computes while the others poll."""
+    cli = _backend["client"] if _backend["mode"] == "redis" else None
+    if cli is None:
+        value = fn(*args, **kwargs)
+        _set(k, value, seconds, tags, stale)
+        return value
+    lock, token = f"brx:lock:{k}", uuid.uuid4().hex
+    if cli.set(lock, token, nx=True, px=max(1, int(wait * 1000))):
+        try:
+            value = fn(*args, **kwargs)
+            _set(k, value, seconds, tags, stale)
+            return value
+        finally:
+            _backend["unlock"](keys=[lock], args=[token])
+    deadline = _now() + wait
+    while _now() < deadline:
+        time.sleep(0.02)
+        ts, value = _get(k)
+        if ts is not None and ts > _now():
+            with _lock: _stats["coalesced"] += 1
+            return value
+    # the other worker is too slow (or died); compute ourselves
+    value = fn(*args, **kwargs)
+    _set(k, value, seconds, tags, stale)
+    return value
+
+def _single_flight(k: str, fn: Callable, args: tuple, kwargs: dict, seconds: int,
+                   tags: Optional[List[str]], stale: int, wait: float):
+    """Coalesce concurrent misses on `k` in this process: one caller computes, the rest wait."""
+    with _lock:
+        flight = _inflight.get(k)
+        leader = flight is None
+        if leader:
+            flight = _inflight[k] = _Flight()
+        else:
+            _stats["coalesced"] += 1
+    if not leader:
+        if flight.event.wait(wait):
+            if flight.error is not None: raise flight.error
+            return flight.value
+        return fn(*args, **kwargs)
+    try:
+        flight.value = _compute_locked(k, fn, args, kwargs, seconds, tags, stale, wait)
+        return flight.value
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(k, None)
+        flight.event.set()
+
+async def _acompute_locked(k: str, fn: Callable, args: tuple, kwargs: dict, seconds: int,
+                           tags: Optional[List[str]], stale: int, wait: float):
+    acli = _backend.get("aclient") if _backend["mode"] == "redis" else None
+    if acli is None:
+        value = await fn(*args, **kwargs)
+        await _aset(k, value, seconds, tags, stale)
+        return value
+    lock, token = f"brx:lock:{k}", uuid.uuid4().hex
+    if await acli.set(lock, token, nx=True, px=max(1, int(wait * 1000))):
+        try:
+            value = await fn(*args, **kwargs)
+            await _aset(k, value, seconds, tags, stale)
+            return value
+        finally:
+            await _backend["aunlock"](keys=[lock], args=[token])
+    deadline = _now() + wait
+    while _now() < deadline:
+        await asyncio.sleep(0.02)
+        ts, value = await _aget(k)
+        if ts is not None and ts > _now():
+            with _lock: _stats["coalesced"] += 1
+            return value
+    value = await fn(*args, **kwargs)
+    await _aset(k, value, seconds, tags, stale)
+    return value
+
+async def _asingle_flight(k: str, fn: Callable, args: tuple, kwargs: dict, seconds: int,
+                          tags: Optional[List[str]], stale: int, wait: float):
+    fut = _ainflight.get(k)
+    if fut is not None:
+        with _lock: _stats["coalesced"] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), wait)
+        except asyncio.TimeoutError:
+            return await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            if not fut.cancelled():
+                raise  # this waiter itself was cancelled
+            # the leader was cancelled (e.g. its client went away): compute or follow a new leader
+            return await _asingle_flight(k, fn, args, kwargs, seconds, tags, stale, wait)
+    fut = _ainflight[k] = asyncio.get_running_loop().create_future()
+    try:
+        value = await _acompute_locked(k, fn, args, kwargs, seconds, tags, stale, wait)
+        fut.set_result(value)
+        return value
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()  # mark retrieved when nobody was waiting
+        raise
+    finally:
+        _ainflight.pop(k, None)
+
+def _resolve_key(key: Optional[str], fn: Callable, args: tuple, kwargs: dict,
+                 vary: Optional[List[Tuple[str, str]]] = None) -> Optional[str]:
+    """The cache key for this call, or None when an argument can't be keyed."""
+    resolved_key = key
+    if key and "{" in key and "}" in key:
+        try:
+            resolved_key = key.format(**kwargs)
+        except Exception:
+            resolved_key = key
+    try:
+        return _make_key(resolved_key, fn, args, kwargs, vary)
+    except _Unkeyable:
+        return None
 
 def cache(seconds: int = 60, *, key: Optional[str] = None, vary: Optional[list[str]] = None,
-          stale: Optional[int] = None, tags: Optional[List[str]] = None, storage: Optional[str] = None):
+          stale: Optional[int] = None, tags: Optional[List[str]] = None, storage: Optional[str] = None,
+          wait: float = 5.0):
+    """Cache fn's result for `seconds`.
+
+    Concurrent misses on the same key are coalesced: one caller computes while
+    the others wait up to `wait` seconds for its result (Redis mode also takes
+    a short-lived `SET NX PX` lock so only one worker computes).
+    `async def` functions get an async wrapper that uses redis.asyncio and
+    shares keys, tags and invalidation with the sync path.
+
+    `vary` adds request values to the key, e.g. ['query.page',
+    'header.accept-language', 'session.user']; the handler must take the
+    `Request`. Request/Response/BackgroundTasks and DB sessions never affect
+    the key. A call with any other argument that has no stable repr (the
+    default `<... object at 0x...>`) is not cached.
+    """
+    vary_spec = _compile_vary(vary)
     if storage:
         useCache(storage)
     def deco(fn: Callable):
+        prefix = _key_prefix(key, fn)
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                k = _resolve_key(key, fn, args, kwargs, vary_spec)
+                if k is None:
+                    return await fn(*args, **kwargs)
+                ts, value = await _aget(k)
+                now = _now()
+                if ts is not None:
+                    if ts > now:
+                        _record(k, prefix, tags, "hit")
+                        return value
+                    if stale and now < ts + stale:
+                        _record(k, prefix, tags, "stale")
+                        _arefresh(k, _atimed(fn, k, prefix, tags), args, kwargs, seconds, tags, stale)
+                        return value
+                _record(k, prefix, tags, "miss")
+                return await _asingle_flight(k, _atimed(fn, k, prefix, tags), args, kwargs,
+                                             seconds, tags, stale or 0, wait)
+            return awrapper
+
+        @functools.wraps(fn)
         def wrapper(*args, **kwargs):
-            resolved_key = key
-            if key and "{" in key and "}" in key:
-                try:
-                    resolved_key = key.format(**kwargs)
-                except Exception:
-                    resolved_key = key
-            k = _make_key(resolved_key, fn, args, kwargs)
+            k = _resolve_key(key, fn, args, kwargs, vary_spec)
+            if k is None:
+                return fn(*args, **kwargs)
             ts, value = _get(k)
             now = _now()
-            if ts is not None and ts > now:
-                return value
-            value = fn(*args, **kwargs)
-            _set(k, value, seconds, tags)
-            return value
-        wrapper.__name__ = fn.__name__
-        wrapper.__doc__ = fn.__doc__
+            if ts is not None:
+                if ts > now:
+                    _record(k, prefix, tags, "hit")
+                    return value
+                # stale-while-revalidate: serve the expired value, refresh in the background
+                if stale and now < ts + stale:
+                    _record(k, prefix, tags, "stale")
+                    _refresh(k, _timed(fn, k, prefix, tags), args, kwargs, seconds, tags, stale)
+                    return value
+            _record(k, prefix, tags, "miss")
+            return _single_flight(k, _timed(fn, k, prefix, tags), args, kwargs, seconds, tags, stale or 0, wait)
         return wrapper
     return deco
@@ -1,19 +1,140 @@
 from __future__ import annotations
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
-from typing import Any
+from typing import Annotated, Any, AsyncIterator, Iterator
+from fastapi import Depends
 from sqlmodel import SQLModel, Field, Session, select
 from pydantic import BaseModel
 from pydantic.alias_generators import to_camel
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from .http import FastJSONResponse
+try:  # needs greenlet: pip install brackets[async]
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlmodel.ext.asyncio.session import AsyncSession
+except Exception:
+    create_async_engine = None
+    AsyncSession = None
 
 _engine = None
+_async = False        # engine uses an async driver (aiosqlite, asyncpg, ...)
+_tables_ready = True  # async engines create tables on first use, inside the event loop
+_tables_lock: asyncio.Lock | None = None
 
-def useDatabase(dsn: str):
-    global _engine
-    _engine = create_engine(dsn, future=True)
-    SQLModel.metadata.create_all(_engine)
+def _sqlite_pragmas(engine, wal: bool):
+    memory = engine.url.database in (None, '', ':memory:')
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        if wal and not memory:
+            cur.execute('PRAGMA journal_mode=WAL')  # readers no longer block the writer
+        cur.execute('PRAGMA synchronous=NORMAL')
+        cur.close()
+
+def useDatabase(dsn: str, *, pool_size: int | None = None, max_overflow: int | None = None,
+                pool_timeout: float | None = None, pool_recycle: int | None = None,
+                pool_pre_ping: bool | None = None, sqlite_wal: bool = True, echo: bool = False):
+    """Create the engine (and tables). Pool options are passed to SQLAlchemy when
+    set; SQLite connections get WAL + synchronous=NORMAL on connect.
+
+    `pool_pre_ping` (a round trip on every checkout) defaults to on for
+    network databases, where pooled connections can go stale, and off for SQLite.
+
+    Async DSNs ('sqlite+aiosqlite://', 'postgresql+asyncpg://') create an
+    async engine: Model methods then return awaitables and resource() builds
+    async routes. Their tables are created on first use.
+    """
+    global _engine, _async, _tables_ready
+    pool = {k: v for k, v in dict(pool_size=pool_size, max_overflow=max_overflow,
+                                  pool_timeout=pool_timeout, pool_recycle=pool_recycle).items()
+            if v is not None}
+    url = make_url(dsn)
+    _async = url.get_dialect().is_async
+    if pool_pre_ping is None:
+        pool_pre_ping = url.get_backend_name() != 'sqlite'
+    if _async:
+        if create_async_engine is None:
+            raise RuntimeError("async database support not installed; pip install brackets[async]")
+        _engine = create_async_engine(dsn, pool_pre_ping=pool_pre_ping, echo=echo, **pool)
+        sync_engine = _engine.sync_engine
+    else:
+        _engine = sync_engine = create_engine(dsn, future=True, pool_pre_ping=pool_pre_ping, echo=echo, **pool)
+    if sync_engine.dialect.name == 'sqlite':
+        _sqlite_pragmas(sync_engine, sqlite_wal)
+    if _async:
+        _tables_ready = False
+    else:
+        SQLModel.metadata.create_all(_engine)
     return _engine
 
+async def _create_tables():
+    global _tables_ready, _tables_lock
+    if _tables_lock is None:
+        _tables_lock = asyncio.Lock()
+    async with _tables_lock:
+        if not _tables_ready:
+            async with _engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+            _tables_ready = True
+
+async def warm():
+    """Open the pool's connections once (and create async tables) so the
+    first requests don't pay for connecting."""
+    if _engine is None:
+        return
+    # QueuePool (and its async variant) keeps size() connections; SQLite's
+    # singleton/static pools hold one
+    n = max(1, _engine.pool.size()) if isinstance(_engine.pool, QueuePool) else 1
+    if _async:
+        if not _tables_ready:
+            await _create_tables()
+        conns = [await _engine.connect() for _ in range(n)]
+        for c in conns: await c.close()
+    else:
+        def _open():
+            conns = [_engine.connect() for _ in range(n)]
+            for c in conns: c.close()
+        await asyncio.to_thread(_open)
+
+def session() -> Iterator[Session]:
+    """FastAPI dependency: one Session (and pooled connection) per request."""
+    with Session(_engine) as s:
+        yield s
+
+async def asession() -> AsyncIterator[Any]:
+    """Async counterpart of session() for async engines."""
+    if not _tables_ready:
+        await _create_tables()
+    async with AsyncSession(_engine) as s:
+        yield s
+
+DB = Annotated[Session, Depends(session)]
+AsyncDB = Annotated[AsyncSession if AsyncSession is not None else Any, Depends(asession)]
+
+@contextmanager
+def _session(db: Session | None):
+    # a caller's session stays open for the rest of its request
+    if db is not None:
+        yield db; return
+    with Session(_engine) as s:
+        yield s
+
+@asynccontextmanager
+async def _asession(db):
+    if db is not None:
+        yield db; return
+    if not _tables_ready:
+        await _create_tables()
+    async with AsyncSession(_engine) as s:
+        yield s
+
+def _payload(obj: dict | BaseModel, partial: bool = False) -> dict:
+    if isinstance(obj, BaseModel):
+        return obj.dict(exclude_unset=partial, by_alias=True)
+    return dict(obj)
+
 class Data(BaseModel):
     class Config:
         alias_generator = to_camel
@@ -29,73 +150,145 @@ def CreatedAt():
 def UpdatedAt():
     return Field(default_factory=datetime.utcnow, nullable=False)
 
+def _touch(inst, patch: dict):
+    for k, v in patch.items(): setattr(inst, k, v)
+    if hasattr(inst, 'updatedAt'): setattr(inst, 'updatedAt', datetime.utcnow())
+
 class Model(SQLModel):
+    """Table base class. With an async engine every method returns an awaitable
+    (`await Todo.all()`) and takes an AsyncSession as `db`."""
     @classmethod
     def all(cls, db=None) -> list[Any]:
-        if db is None: db = Session(_engine)
-        with db as s:
+        if _async: return cls._aall(db)
+        with _session(db) as s:
             return list(s.exec(select(cls)))
 
     @classmethod
     def find(cls, db, id: Any):
-        if db is None: db = Session(_engine)
-        with db as s:
+        if _async: return cls._afind(db, id)
+        with _session(db) as s:
             return s.get(cls, id)
 
     @classmethod
     def add(cls, db, obj: dict | BaseModel):
-        if db is None: db = Session(_engine)
-        data = obj.dict(by_alias=True) if isinstance(obj, BaseModel) else dict(obj)
-        inst = cls(**data)
-        with db as s:
+        if _async: return cls._aadd(db, obj)
+        inst = cls(**_payload(obj))
+        with _session(db) as s:
             s.add(inst); s.commit(); s.refresh(inst)
             return inst
 
     @classmethod
     def edit(cls, db, id: Any, obj: dict | BaseModel):
-        if db is None: db = Session(_engine)
-        patch = obj.dict(exclude_unset=True, by_alias=True) if isinstance(obj, BaseModel) else dict(obj)
-        with db as s:
+        if _async: return cls._aedit(db, id, obj)
+        patch = _payload(obj, partial=True)
+        with _session(db) as s:
             inst = s.get(cls, id)
             if not inst: return None
-            for k, v in patch.items(): setattr(inst, k, v)
-            if hasattr(inst, 'updatedAt'): setattr(inst, 'updatedAt', datetime.utcnow())
+            _touch(inst, patch)
             s.add(inst); s.commit(); s.refresh(inst)
             return inst
 
     @classmethod
     def remove(cls, db, id: Any):
-        if db is None: db = Session(_engine)
-        with db as s:
+        if _async: return cls._aremove(db, id)
+        with _session(db) as s:
             inst = s.get(cls, id)
             if not inst: return None
             s.delete(inst); s.commit(); return True
 
+    # async engine counterparts
+
+    @classmethod
+    async def _aall(cls, db) -> list[Any]:
+        async with _asession(db) as s:
+            return list(await s.exec(select(cls)))
+
+    @classmethod
+    async def _afind(cls, db, id: Any):
+        async with _asession(db) as s:
+            return await s.get(cls, id)
+
+    @classmethod
+    async def _aadd(cls, db, obj: dict | BaseModel):
+        inst = cls(**_payload(obj))
+        async with _asession(db) as s:
+            s.add(inst); await s.commit(); await s.refresh(inst)
+            return inst
+
+    @classmethod
+    async def _aedit(cls, db, id: Any, obj: dict | BaseModel):
+        patch = _payload(obj, partial=True)
+        async with _asession(db) as s:
+            inst = await s.get(cls, id)
+            if not inst: return None
+            _touch(inst, patch)
+            s.add(inst); await s.commit(); await s.refresh(inst)
+            return inst
+
+    @classmethod
+    async def _aremove(cls, db, id: Any):
+        async with _asession(db) as s:
+            inst = await s.get(cls, id)
+            if not inst: return None
+            await s.delete(inst); await s.commit(); return True
+
 def resource(path: str, *, model: type[Model], Create: type[Data]|None=None, Update: type[Data]|None=None, tags: list[str]|None=None):
     from fastapi import APIRouter, Body
-    router = APIRouter(prefix=path, tags=tags or [model.__name__])
+    # routes return FastJSONResponse, which encodes rows directly instead of
+    # running each one through jsonable_encoder
+    router = APIRouter(prefix=path, tags=tags or [model.__name__], default_response_class=FastJSONResponse)
+    if _async:
+        return _async_resource(router, model, Create, Update)
+
+    @router.get('/')
+    def list_items(db: DB):
+        return FastJSONResponse(model.all(db))
+
+    @router.post('/')
+    def create(db: DB, payload: dict = Body(...)):
+        obj = Create(**payload) if Create else payload
+        return FastJSONResponse(model.add(db, obj))
+
+    @router.get('/{id}')
+    def read(db: DB, id: int):
+        return FastJSONResponse(model.find(db, id))
+
+    @router.patch('/{id}')
+    def update(db: DB, id: int, payload: dict = Body(...)):
+        obj = Update(**payload) if Update else payload
+        return FastJSONResponse(model.edit(db, id, obj))
+
+    @router.delete('/{id}')
+    def delete(db: DB, id: int):
+        model.remove(db, id); return FastJSONResponse({"ok": True})
+
+    return router
+
+def _async_resource(router, model: type[Model], Create: type[Data]|None, Update: type[Data]|None):
+    # same routes as resource(), served on the event loop instead of the threadpool
+    from fastapi import Body
 
     @router.get('/')
-    def list_items():
-        return [r for r in model.all(None)]
+    async def list_items(db: AsyncDB):
+        return FastJSONResponse(await model.all(db))
 
     @router.post('/')
-    def create(payload: dict = Body(...)):
+    async def create(db: AsyncDB, payload: dict = Body(...)):
         obj = Create(**payload) if Create else payload
-        return model.add(None, obj)
+        return FastJSONResponse(await model.add(db, obj))
 
     @router.get('/{id}')
-    def read(id: int):
-        return model.find(None, id)
+    async def read(db: AsyncDB, id: int):
+        return FastJSONResponse(await model.find(db, id))
 
     @router.patch('/{id}')
-    def update(id: int, payload: dict = Body(...)):
+    async def update(db: AsyncDB, id: int, payload: dict = Body(...)):
         obj = Update(**payload) if Update else payload
-        return model.edit(None, id, obj)
+        return FastJSONResponse(await model.edit(db, id, obj))
 
     @router.delete('/{id}')
-    def delete(id: int):
-        model.remove(None, id); return {"ok": True}
+    async def delete(db: AsyncDB, id: int):
+        await model.remove(db, id); return FastJSONResponse({"ok": True})
 
     return router
 
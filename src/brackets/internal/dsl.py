@@ -1,51 +1,53 @@
 # Compiler for .bx templates (React-ish → Jinja + hidden HTMX attrs)
+#
+# compile_bx() output is byte-for-byte what the old multi-pass compiler produced
+# (tests/dsl_golden/expected): loops and braces, then <RouteView/>, then <Link>,
+# each in one linear scan instead of re-searching from every offset.
+#
+# compile_bx(..., compat=False) opts in to the corrected output
+# (tests/dsl_golden/expected_fixed): one left-to-right scan with a single master
+# regex tokenizes the source, a stack-based parser builds a small tree for
+# [for]/[empty]/[between], and one traversal emits the Jinja. Leaf constructs
+# (braces, <Link>, <RouteView/>, forms, buttons) are emitted while parsing.
 import re, html, pathlib
 
-def _to_jinja_braces(s: str) -> str:
-    return re.sub(r'\{([^{}\n][^{}]*)\}', r'{{ \1 }}', s)
+DEFAULT_TARGET = '#app'
 
 FOR_RE = re.compile(r'\[for\s+([^\]\s]+)(?:\s+as\s+([A-Za-z_][A-Za-z0-9_]*))?(?:\s+key\s+([^\]\s]+))?(?:\s+when\s+([^\]]+))?\]')
-EMPTY_RE = re.compile(r'\[empty\]')
-BETWEEN_RE = re.compile(r'\[between\]')
-ENDFOR_RE = re.compile(r'\[/for\]')
+ATTR_RE = re.compile(r'([A-Za-z_:][-\w:]*)(?:="([^"]*)")?')
+LINK_CLOSE_RE = re.compile(r'</Link\s*>')
 
-def _compile_loops_and_braces(source: str) -> str:
-    out, i = [], 0
-    while i < len(source):
-        m = FOR_RE.search(source, i)
-        if not m:
-            out.append(_to_jinja_braces(source[i:])); break
-        out.append(_to_jinja_braces(source[i:m.start()]))
-        iterable, alias, keyexpr, whenexpr = m.groups()
-        alias = alias or '__it'
-        cond = f' if {whenexpr}' if whenexpr else ''
-        out.append(f'{{% for {alias} in ({iterable} or []){cond} %}}')
-        last = m.end()
-        while True:
-            m_empty = EMPTY_RE.search(source, last)
-            m_between = BETWEEN_RE.search(source, last)
-            m_end = ENDFOR_RE.search(source, last)
-            next_pos = min([p.start() for p in [m_empty, m_between, m_end] if p] or [len(source)])
-            seg = source[last:next_pos].replace('{.', '{{ '+alias+'.')
-            out.append(_to_jinja_braces(seg))
-            if m_end and m_end.start() == next_pos:
-                out.append('{% endfor %}'); i = m_end.end(); break
-            elif m_empty and m_empty.start() == next_pos:
-                out.append('{% else %}'); last = m_empty.end()
-            elif m_between and m_between.start() == next_pos:
-                k = m_between.end()
-                nxt = min([x for x in [EMPTY_RE.search(source, k), BETWEEN_RE.search(source, k), ENDFOR_RE.search(source, k)] if x], key=lambda x:x.start())
-                mid = source[k:nxt.start()].replace('{.', '{{ '+alias+'.')
-                out.append('{% if not loop.last %}'); out.append(_to_jinja_braces(mid)); out.append('{% endif %}')
-                last = nxt.start()
-            else:
-                i = next_pos; break
-    return ''.join(out)
+_JINJA = r'\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\}'
+_BRACE = r'\{(?P<expr>[^{}\n][^{}]*)\}'
+_TOKEN_RE = re.compile('|'.join([
+    rf'(?P<jinja>{_JINJA})',
+    rf'(?P<brace>{_BRACE})',
+    rf'(?P<for>{FOR_RE.pattern})',
+    r'(?P<empty>\[empty\])',
+    r'(?P<between>\[between\])',
+    r'(?P<endfor>\[/for\])',
+    r'(?P<routeview>(?i:<RouteView\b)[^>]*>)',
+    r'(?P<link><Link\b[^>]*>)',
+    rf'(?P<linkclose>{LINK_CLOSE_RE.pattern})',
+    r'(?P<form>(?i:<form\b)[^>]*>)',
+    r'(?P<button>(?i:<button\b)[^>]*>)',
+]), re.S)
+_BRACES_RE = re.compile(rf'(?P<jinja>{_JINJA})|{_BRACE}', re.S)
 
-ATTR_RE = re.compile(r'([A-Za-z_:][-\w:]*)(?:="([^"]*)")?')
-LINK_OPEN_RE = re.compile(r'<Link\b([^>]*)>', re.I | re.S)
-LINK_CLOSE_RE = re.compile(r'</Link\s*>', re.I)
-ROUTEVIEW_RE = re.compile(r'<RouteView\b([^>]*)/?>', re.I)
+# the attribute, bare (<form onSubmit>) or with a value (onClick={go}, onclick="go()")
+ON_SUBMIT_RE = re.compile(r'\bonSubmit\b|\bonsubmit\b')
+ON_SUBMIT_ATTR_RE = re.compile(r'\s(onSubmit|onsubmit)(=(\{[^}]*\}|"[^"]*"))?(?=[\s/>])')
+ON_CLICK_RE = re.compile(r'\bonClick\b|\bonclick\b')
+ON_CLICK_ATTR_RE = re.compile(r'\s(onClick|onclick)(=(\{[^}]*\}|"[^"]*"))?(?=[\s/>])')
+ACTION_RE = re.compile(r'action="([^"]*)"')
+DATA_ACTION_RE = re.compile(r'data-action="([^"]+)"')
+
+# compat: the old compiler's patterns
+COMPAT_BRACE_RE = re.compile(r'\{([^{}\n][^{}]*)\}')
+COMPAT_MARKER_RE = re.compile(r'(?P<empty>\[empty\])|(?P<between>\[between\])|(?P<endfor>\[/for\])')
+COMPAT_ROUTEVIEW_RE = re.compile(r'<RouteView\b([^>]*)/?>', re.I)
+COMPAT_LINK_OPEN_RE = re.compile(r'<Link\b([^>]*)>', re.I | re.S)
+COMPAT_LINK_CLOSE_RE = re.compile(r'</Link\s*>', re.I)
 
 def _parse_attrs(attr_text: str) -> dict:
     attrs = {}
@@ -59,73 +61,218 @@ def _attrs_to_html(attrs: dict) -> str:
         parts.append(k if v is True else f'{k}="{html.escape(str(v), True)}"')
     return (' ' + ' '.join(parts)) if parts else ''
 
-def _transform_routeview(s: str) -> str:
-    def repl(m):
-        attrs = _parse_attrs(m.group(1)); rid = attrs.get('id','app')
-        extra = {k:v for k,v in attrs.items() if k.lower()!='id'}
-        out = {'id': rid, 'data-bx-routeview': '1', 'hx-swap-oob': 'true', **extra}
-        return f'<div{_attrs_to_html(out)}></div>'
-    return ROUTEVIEW_RE.sub(repl, s)
-
-def _transform_links(html_in: str, default_target='#app') -> str:
-    def repl_link(m):
-        raw = m.group(1); close = LINK_CLOSE_RE.search(html_in, m.end())
-        inner = '' if not close else html_in[m.end():close.start()]
-        attrs = _parse_attrs(raw)
-        to = attrs.pop('to', None) or attrs.get('href') or '/'
-        prefetch = bool(attrs.pop('prefetch', False))
-        out_attrs = {'href': to, 'hx-get': to, 'hx-target': default_target, 'hx-push-url': 'true', 'data-bx-link': '1'}
-        if prefetch: out_attrs['data-bx-prefetch'] = '1'
-        for k,v in list(attrs.items()):
-            if k.lower() not in ('to','prefetch'): out_attrs[k]=v
-        return f'<a{_attrs_to_html(out_attrs)}>{inner}</a>'
+# ---------- leaf emitters ----------
+
+def _expr(expr: str, alias: str | None) -> str:
+    # {.field} inside a loop reads from the loop alias, {.} is the item itself
+    if alias and expr.startswith('.'):
+        expr = alias if expr == '.' else alias + expr
+    return '{{ ' + expr + ' }}'
+
+def _braces(text: str, alias: str | None) -> str:
+    """Braces → Jinja inside a tag's attribute text; existing Jinja is left alone."""
+    if '{' not in text:
+        return text
+    return _BRACES_RE.sub(lambda m: m.group(0) if m.group('jinja') else _expr(m.group('expr'), alias), text)
+
+def _routeview(attr_text: str) -> str:
+    attrs = _parse_attrs(attr_text); rid = attrs.get('id', 'app')
+    extra = {k: v for k, v in attrs.items() if k.lower() != 'id'}
+    out = {'id': rid, 'data-bx-routeview': '1', 'hx-swap-oob': 'true', **extra}
+    return f'<div{_attrs_to_html(out)}></div>'
+
+def _link_open(attr_text: str, target: str = DEFAULT_TARGET) -> str:
+    attrs = _parse_attrs(attr_text)
+    to = attrs.pop('to', None) or attrs.get('href') or '/'
+    prefetch = bool(attrs.pop('prefetch', False))
+    out_attrs = {'href': to, 'hx-get': to, 'hx-target': target, 'hx-push-url': 'true', 'data-bx-link': '1'}
+    if prefetch: out_attrs['data-bx-prefetch'] = '1'
+    for k, v in attrs.items():
+        if k.lower() not in ('to', 'prefetch'): out_attrs[k] = v
+    return f'<a{_attrs_to_html(out_attrs)}>'
+
+def _form(tag: str, alias: str | None, target: str = DEFAULT_TARGET) -> str:
+    if not ON_SUBMIT_RE.search(tag): return _braces(tag, alias)
+    tag = _braces(ON_SUBMIT_ATTR_RE.sub('', tag), alias)
+    mact = ACTION_RE.search(tag)
+    inject = [f'hx-post="{html.escape(mact.group(1), True)}"'] if mact else ['hx-boost="true"']
+    inject += [f'hx-target="{target}"', 'hx-push-url="true"']
+    return tag[:-1] + ' ' + ' '.join(inject) + '>'
+
+def _button(tag: str, alias: str | None, target: str = DEFAULT_TARGET) -> str:
+    if not ON_CLICK_RE.search(tag): return _braces(tag, alias)
+    out = _braces(ON_CLICK_ATTR_RE.sub('', tag), alias)
+    mact = DATA_ACTION_RE.search(out)  # after brace conversion, like _form's action
+    if not mact: return _braces(tag, alias)
+    return out[:-1] + f' hx-post="{html.escape(mact.group(1), True)}" hx-target="{target}" hx-push-url="true">'
+
+# ---------- tree ----------
+
+class _For:
+    __slots__ = ('iterable', 'alias', 'when', 'body', 'orelse', 'closed')
+    def __init__(self, iterable: str, alias: str | None, when: str | None):
+        self.iterable, self.alias, self.when = iterable, alias or '__it', when
+        self.body: list = []
+        self.orelse: list | None = None
+        self.closed = False
+
+class _Between:
+    __slots__ = ('body',)
+    def __init__(self): self.body: list = []
+
+def _children(node) -> list:
+    if isinstance(node, _For):
+        return node.body if node.orelse is None else node.orelse
+    return node.body
+
+def _last_link_close(source: str) -> int:
+    i = source.rfind('</Link')
+    while i != -1 and not LINK_CLOSE_RE.match(source, i):
+        i = source.rfind('</Link', 0, i)
+    return i
+
+def _parse(source: str) -> list:
+    root: list = []
+    stack: list = []          # open _For / _Between nodes
+    out = root                # list the next node is appended to
+    alias = None              # innermost loop alias
+    in_link = False
+    last_close = _last_link_close(source)
+    pos = 0
+
+    def unwind():
+        # [empty]/[between]/[/for] end an open [between] section; returns the innermost loop.
+        if stack and isinstance(stack[-1], _Between): stack.pop()
+        return stack[-1] if stack else None
+
+    for m in _TOKEN_RE.finditer(source):
+        if m.start() > pos: out.append(source[pos:m.start()])
+        pos = m.end()
+        kind, tok = m.lastgroup, m.group(0)
+        if kind == 'jinja':
+            out.append(tok)
+        elif kind == 'brace':
+            out.append(_expr(m.group('expr'), alias))
+        elif kind == 'for':
+            iterable, name, _key, when = FOR_RE.match(tok).groups()
+            if alias and iterable.startswith('.'): iterable = alias + iterable  # [for .children]
+            node = _For(iterable, name, when)
+            out.append(node); stack.append(node); out = node.body; alias = node.alias
+        elif kind in ('empty', 'between', 'endfor'):
+            node = unwind()
+            if node is None:
+                out.append(tok)
+            elif kind == 'endfor':
+                node.closed = True; stack.pop()
+                out = _children(stack[-1]) if stack else root
+                alias = stack[-1].alias if stack else None
+            elif kind == 'empty':
+                if node.orelse is None: node.orelse = []
+                out = node.orelse
+            else:
+                b = _Between(); _children(node).append(b); stack.append(b); out = b.body
+        elif kind == 'routeview':
+            out.append(_routeview(_braces(tok[len('<RouteView'):-1], alias)))
+        elif kind == 'link':
+            # A <Link> runs to the first </Link> after it (no nesting); without one it is empty.
+            if in_link:
+                out.append(_braces(tok, alias))
+            elif m.end() <= last_close:
+                out.append(_link_open(_braces(tok[len('<Link'):-1], alias))); in_link = True
+            else:
+                out.append(_link_open(_braces(tok[len('<Link'):-1], alias)) + '</a>')
+        elif kind == 'linkclose':
+            out.append('</a>' if in_link else tok); in_link = False
+        elif kind == 'form':
+            out.append(_form(tok, alias))
+        elif kind == 'button':
+            out.append(_button(tok, alias))
+    if pos < len(source): out.append(source[pos:])
+    return root
+
+def _emit(nodes: list, out: list):
+    for n in nodes:
+        if isinstance(n, str):
+            out.append(n)
+        elif isinstance(n, _For):
+            cond = f' if {n.when}' if n.when else ''
+            out.append(f'{{% for {n.alias} in ({n.iterable} or []){cond} %}}')
+            _emit(n.body, out)
+            if n.orelse is not None:
+                out.append('{% else %}'); _emit(n.orelse, out)
+            if n.closed: out.append('{% endfor %}')
+        else:
+            out.append('{% if not loop.last %}'); _emit(n.body, out); out.append('{% endif %}')
+
+# ---------- compat: the old compiler's passes, each linear ----------
+
+def _compat_braces(seg: str, alias: str | None = None) -> str:
+    if alias: seg = seg.replace('{.', '{{ ' + alias + '.')
+    return COMPAT_BRACE_RE.sub(r'{{ \1 }}', seg) if '{' in seg else seg
+
+def _compat_loops(source: str) -> str:
+    # Flat loops only: inside a loop a [for] is text and the first [/for] closes it.
+    out, i = [], 0
+    while i < len(source):
+        m = FOR_RE.search(source, i)
+        if not m:
+            out.append(_compat_braces(source[i:])); break
+        out.append(_compat_braces(source[i:m.start()]))
+        iterable, alias, _key, when = m.groups()
+        alias = alias or '__it'
+        cond = f' if {when}' if when else ''
+        out.append(f'{{% for {alias} in ({iterable} or []){cond} %}}')
+        last = m.end()
+        while True:
+            mk = COMPAT_MARKER_RE.search(source, last)
+            end = mk.start() if mk else len(source)
+            out.append(_compat_braces(source[last:end], alias))
+            if mk is None:
+                i = end; break
+            if mk.lastgroup == 'endfor':
+                out.append('{% endfor %}'); i = mk.end(); break
+            if mk.lastgroup == 'empty':
+                out.append('{% else %}'); last = mk.end()
+            else:
+                nxt = COMPAT_MARKER_RE.search(source, mk.end())
+                last = nxt.start() if nxt else len(source)
+                out.append('{% if not loop.last %}')
+                out.append(_compat_braces(source[mk.end():last], alias))
+                out.append('{% endif %}')
+    return ''.join(out)
+
+def _compat_links(s: str) -> str:
+    # A <Link> takes everything up to the first </Link> after it, as is.
+    last_close = -1
+    for m in COMPAT_LINK_CLOSE_RE.finditer(s):
+        last_close = m.start()
     out, i = [], 0
     while True:
-        m = LINK_OPEN_RE.search(html_in, i)
-        if not m: out.append(html_in[i:]); break
-        out.append(html_in[i:m.start()])
-        close = LINK_CLOSE_RE.search(html_in, m.end())
-        out.append(repl_link(m))
-        i = (close.end() if close else m.end())
+        m = COMPAT_LINK_OPEN_RE.search(s, i)
+        if not m: out.append(s[i:]); break
+        out.append(s[i:m.start()])
+        close = COMPAT_LINK_CLOSE_RE.search(s, m.end()) if m.end() <= last_close else None
+        out.append(_link_open(m.group(1)) + (s[m.end():close.start()] if close else '') + '</a>')
+        i = close.end() if close else m.end()
     return ''.join(out)
 
-def _transform_forms_buttons(s: str, default_target='#app') -> str:
-    def form_repl(match):
-        tag = match.group(0)
-        if not re.search(r'\\bonSubmit\\b|\\bonsubmit\\b', tag): return tag
-        mact = re.search(r'action="([^"]*)"', tag)
-        tag2 = re.sub(r'\\s(onSubmit|onsubmit)=(\\{[^}]*\\}|"[^"]*")', '', tag)
-        inject = []
-        if mact: inject.append(f'hx-post="{html.escape(mact.group(1), True)}"')
-        else: inject.append('hx-boost="true"')
-        inject += [f'hx-target="{default_target}"', 'hx-push-url="true"']
-        return re.sub(r'>$',' ' + ' '.join(inject) + '>', tag2)
-    s = re.sub(r'<form\\b[^>]*>', form_repl, s, flags=re.I)
-    def btn_repl(match):
-        tag = match.group(0)
-        if not re.search(r'\\bonClick\\b|\\bonclick\\b', tag): return tag
-        mact = re.search(r'data-action="([^"]+)"', tag)
-        if not mact: return tag
-        tag2 = re.sub(r'\\s(onClick|onclick)=(\\{[^}]*\\}|"[^"]*")', '', tag)
-        inject = f' hx-post="{html.escape(mact.group(1), True)}" hx-target="{default_target}" hx-push-url="true"'
-        return tag2[:-1] + inject + '>'
-    s = re.sub(r'<button\\b[^>]*>', btn_repl, s, flags=re.I)
-    return s
-
-def compile_bx(source: str) -> str:
-    s = _compile_loops_and_braces(source)
-    s = _transform_routeview(s)
-    s = _transform_links(s)
-    s = _transform_forms_buttons(s)
-    return s
+def compile_bx(source: str, *, compat: bool = True) -> str:
+    """Compile .bx source to Jinja; compat=False opts in to the corrected output."""
+    if compat:
+        s = _compat_loops(source)
+        s = COMPAT_ROUTEVIEW_RE.sub(lambda m: _routeview(m.group(1)), s) if '<' in s else s
+        return _compat_links(s) if '<' in s else s
+    out: list = []
+    _emit(_parse(source), out)
+    return ''.join(out)
 
 class bx:
     @staticmethod
-    def compile(src: str) -> str: return compile_bx(src)
+    def compile(src: str, *, compat: bool = True) -> str: return compile_bx(src, compat=compat)
     @staticmethod
-    def file(path: str) -> str:
+    def file(path: str, *, compat: bool = True) -> str:
         p = pathlib.Path(path)
-        return compile_bx(p.read_text(encoding='utf-8'))
+        return compile_bx(p.read_text(encoding='utf-8'), compat=compat)
     @staticmethod
-    def lines(*lines: str) -> str:
-        return compile_bx('\\n'.join(lines))
+    def lines(*lines: str, compat: bool = True) -> str:
+        return compile_bx('\\n'.join(lines), compat=compat)
@@ -1,11 +1,122 @@
+from __future__ import annotations
+import asyncio, inspect, json
+from typing import Any, Callable
 from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from .plugins import _emit
+from .security import CSRF_MAX_BODY
+
+# Client events are buffered by brackets.js and posted as JSON arrays. The
+# endpoint only enqueues; one consumer task per process drains the bounded
+# queue and hands batches to the handlers, so a slow handler never holds up
+# requests — when the queue is full, new events are dropped and counted.
+# A POST over max_body bytes or max_per_request events is refused with 413.
+
+_config = {"queue_size": 10_000, "batch_size": 500, "max_per_request": 1_000, "max_body": CSRF_MAX_BODY}
+_handlers: list[Callable] = []
+_stats = {"accepted": 0, "dropped": 0, "batches": 0, "dispatched": 0, "errors": 0}
+_queue: asyncio.Queue | None = None
+_consumer: asyncio.Task | None = None
+
+def useEvents(*handlers: Callable, queue_size: int = 10_000, batch_size: int = 500,
+              max_per_request: int = 1_000, max_body: int = CSRF_MAX_BODY):
+    """Register batch handlers for /bx/event and size the pipeline.
+
+    Each handler gets a list of event dicts (`async def` handlers are awaited,
+    plain ones run in a worker thread); plugins get `onEvents(batch)`.
+    At most `queue_size` events wait in memory; events that don't fit are
+    dropped and counted in stats(). A POST with more than `max_per_request`
+    events or a body over `max_body` bytes gets 413 and nothing is queued.
+    """
+    global _queue
+    _handlers.extend(handlers)
+    if queue_size != _config["queue_size"]:
+        _queue = None  # recreated at the new size on the next event
+    _config.update(queue_size=queue_size, batch_size=batch_size, max_per_request=max_per_request,
+                   max_body=max_body)
+
+def _ensure_consumer() -> asyncio.Queue:
+    global _queue, _consumer
+    loop = asyncio.get_running_loop()
+    if _queue is None or _consumer is None or _consumer.get_loop() is not loop:
+        _queue = asyncio.Queue(_config["queue_size"])
+        _consumer = loop.create_task(_consume(_queue))
+    elif _consumer.done():
+        _consumer = loop.create_task(_consume(_queue))
+    return _queue
+
+async def _dispatch(batch: list[dict]):
+    _stats["batches"] += 1; _stats["dispatched"] += len(batch)
+    _emit("onEvents", batch)
+    for h in _handlers:
+        try:
+            if inspect.iscoroutinefunction(h):
+                await h(batch)
+            else:
+                await asyncio.to_thread(h, batch)
+        except Exception:
+            _stats["errors"] += 1  # a failing handler shouldn't stop the pipeline
+
+async def _consume(q: asyncio.Queue):
+    while True:
+        batch = [await q.get()]
+        # take whatever else is already waiting, up to one batch
+        while len(batch) < _config["batch_size"] and not q.empty():
+            batch.append(q.get_nowait())
+        await _dispatch(batch)
+
+def _enqueue(events: list[Any]) -> tuple[int, int]:
+    q = _ensure_consumer()
+    accepted = dropped = 0
+    for ev in events:
+        if not isinstance(ev, dict):
+            dropped += 1; continue
+        try:
+            q.put_nowait(ev); accepted += 1
+        except asyncio.QueueFull:
+            dropped += 1
+    _stats["accepted"] += accepted; _stats["dropped"] += dropped
+    return accepted, dropped
+
+def stats() -> dict:
+    return {**_stats, "queued": _queue.qsize() if _queue is not None else 0}
 
 _events_router = APIRouter()
 
+async def _read_body(request: Request, limit: int) -> bytes | None:
+    """The request body, or None as soon as it is known to exceed `limit` bytes."""
+    try:
+        if int(request.headers.get('content-length') or 0) > limit:
+            return None
+    except ValueError:
+        pass
+    body = b''
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            return None
+    return body
+
 @_events_router.post('/bx/event')
 async def event_sink(request: Request):
-    data = await request.form()
-    return {"ok": True}
+    body = await _read_body(request, _config["max_body"])
+    if body is None:
+        return JSONResponse({"ok": False}, status_code=413)
+    if request.headers.get('content-type', '').startswith('application/json'):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return JSONResponse({"ok": False}, status_code=400)
+        events = data if isinstance(data, list) else [data]
+    else:
+        async def replay():
+            return {"type": "http.request", "body": body, "more_body": False}
+        # single form-encoded event (older clients)
+        events = [dict(await Request(request.scope, replay).form())]
+    if len(events) > _config["max_per_request"]:
+        return JSONResponse({"ok": False}, status_code=413)
+    accepted, dropped = _enqueue(events)
+    return JSONResponse({"ok": True, "accepted": accepted, "dropped": dropped}, status_code=202)
 
 def mount_events(app):
     app.include_router(_events_router)
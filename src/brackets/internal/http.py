@@ -1,29 +1,212 @@
 from __future__ import annotations
+import hashlib, json as _json
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
 from typing import Any
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from uuid import UUID
+from markupsafe import Markup
+from pydantic import BaseModel
+from pydantic.alias_generators import to_camel
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
+from starlette.requests import HTTPConnection
+from .cache import _get, _set, _now
+from .render import STREAM_BUFFER, coalesce
+try:  # pip install brackets[web]
+    import orjson  # type: ignore
+except Exception:
+    orjson = None
+
+def _etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # weak comparison, as If-None-Match requires
+    return any(t.strip().removeprefix('W/') == etag for t in header.split(','))
+
+_PAGE_PLAIN = (str, int, float, bool, bytes, type(None))
+
+def _page_part(v: Any) -> str | None:
+    """Text that changes whenever `v` renders differently, or None when `v` can't
+    be fingerprinted (address reprs, requests); such pages aren't cached."""
+    if isinstance(v, _PAGE_PLAIN):
+        return repr(v)
+    if isinstance(v, (list, tuple, set, frozenset)):
+        parts = [_page_part(x) for x in v]
+        if None in parts:
+            return None
+        if isinstance(v, (set, frozenset)):
+            parts.sort()
+        return '[' + ','.join(parts) + ']'
+    if isinstance(v, dict):
+        items = [(_page_part(k), _page_part(x)) for k, x in v.items()]
+        if any(k is None or x is None for k, x in items):
+            return None
+        return '{' + ','.join(sorted(f'{k}:{x}' for k, x in items)) + '}'
+    if isinstance(v, HTTPConnection):
+        return None  # anything on the request could end up in the page
+    if isinstance(v, BaseModel):
+        try:
+            return type(v).__qualname__ + v.model_dump_json()
+        except Exception:
+            return None
+    if type(v).__repr__ is object.__repr__:
+        return None
+    r = repr(v)
+    return None if ' at 0x' in r else r
+
+def _page_key(template: str, ctx: dict, hx: bool, layout: str | None, block: str | None) -> str | None:
+    fp = _page_part(ctx)
+    if fp is None:
+        return None
+    fp = hashlib.blake2b(fp.encode(), digest_size=16).hexdigest()
+    return f"page:{template}:{fp}:{'hx' if hx else 'full'}:{layout or '-'}:{block or '-'}"
+
+def _render(app, template: str, ctx: dict, layout: str | None, block: str | None, hx: bool) -> str:
+    if hx:
+        return app.env.render_block(template, block, **ctx) if block else app.render(template, **ctx)
+    html = app.render(template, **ctx)
+    if layout and app.env.has_template(layout):
+        html = app.render(layout, **{**ctx, 'children': Markup(html)})
+    return html
+
+_CHILDREN = '\x00brx:children\x00'
+
+def _stream(app, template: str, ctx: dict, layout: str | None, block: str | None, hx: bool, size: int):
+    if hx and block:
+        return iter([app.env.render_block(template, block, **ctx)])
+    if hx or not (layout and app.env.has_template(layout)):
+        return app.env.stream(template, _buffer=size, **ctx)
+    # the layout is small: render it around a marker and stream the page in its place
+    shell = app.render(layout, **{**ctx, 'children': Markup(_CHILDREN)})
+    if shell.count(_CHILDREN) != 1:
+        # no single {children} slot to stream into (missing, repeated, or transformed
+        # by a filter): send the page exactly as the non-streamed path renders it
+        return iter([_render(app, template, ctx, layout, block, hx)])
+    head, _, tail = shell.partition(_CHILDREN)
+    body = app.env.stream(template, _buffer=size, **ctx)
+    def chunks():
+        yield head
+        yield from body
+        yield tail
+    return coalesce(chunks(), size)
 
 def page(template: str | None = None, /, **ctx: Any):
     """Render a template via app.env.
     Usage: return page('pages/index.bx', title='Welcome', _app=app)
+
+    Every page carries an ETag. With the request available (`_request=request`
+    or any Request in ctx) a matching If-None-Match gets a bodiless 304.
+    `_cache=<seconds>` keeps the rendered page in the cache backend, keyed by
+    template + context + HX-Request + layout/block and tagged `page:<template>`;
+    a context that can't be fingerprinted (objects without a repr, a Request)
+    is rendered every time instead;
+    `_cache_control='...'` sets Cache-Control.
+
+    Layouts are opt-in: with the request available and a layout named by
+    `App(layout=...)` or `_layout=` (which overrides it; `_layout=None` turns it
+    off), full loads are wrapped in that layout with the page as `{children}`,
+    while HTMX requests get only the fragment: the page itself, or just
+    `_block='name'` of it. Pages rendered with `_block` extend their own
+    layout, so they skip the app layout unless `_layout=` names one.
+
+    `_stream=True` (or a chunk size in chars) sends the page as it renders,
+    via Jinja's generate(), in chunks of about 8 KB; there is no ETag or page
+    cache for streamed responses.
     """
     app = ctx.pop('_app', None)
+    request = ctx.pop('_request', None)
+    cache_for = ctx.pop('_cache', 0)
+    cache_control = ctx.pop('_cache_control', None)
+    layout = ctx.pop('_layout', ...)
+    block = ctx.pop('_block', None)
+    stream = ctx.pop('_stream', False)
     if app is None:
         for v in ctx.values():
             if hasattr(v, 'env'):
                 app = v; break
         if app is None:
             raise RuntimeError("page(...) requires _app=app or an object with .env")
-    html = app.render(template, **ctx)
-    return HTMLResponse(html)
+    if request is None:
+        request = next((v for v in ctx.values() if isinstance(v, HTTPConnection)), None)
+    if request is None:
+        layout = None  # can't tell a navigation from a full load; render the page as-is
+    elif layout is ...:
+        # a _block page extends its own document; wrapping it again would nest two
+        layout = None if block else getattr(app, 'layout', None)
+    # history restores ask for a whole document even though they come from htmx
+    hx = (request is not None and request.headers.get('hx-request') == 'true'
+          and request.headers.get('hx-history-restore-request') != 'true')
+    headers = {'Vary': 'HX-Request'} if layout or block else {}
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+    if stream:
+        size = STREAM_BUFFER if stream is True else int(stream)
+        return StreamingResponse(_stream(app, template, ctx, layout, block, hx, size),
+                                 media_type='text/html', headers=headers)
+    html = etag = key = None
+    if cache_for:
+        # the app itself is how page() finds the renderer, not page data
+        key = _page_key(template, {k: v for k, v in ctx.items() if v is not app}, hx, layout, block)
+    if key is not None:
+        ts, hit = _get(key)
+        if ts is not None and ts > _now():
+            html, etag = hit
+    if html is None:
+        html = _render(app, template, ctx, layout, block, hx)
+        etag = f'"{app.env.etag_for(html)}"'
+        if key is not None:
+            _set(key, (html, etag), cache_for, [f'page:{template}'])
+    headers['ETag'] = etag
+    if request is not None and _etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(html, headers=headers)
+
+# table class -> ((attribute, camelCase key), ...), like Data's aliases
+_row_keys: dict[type, tuple[tuple[str, str], ...]] = {}
+
+def _row(obj) -> dict:
+    cls = type(obj)
+    keys = _row_keys.get(cls)
+    if keys is None:
+        keys = _row_keys[cls] = tuple((n, f.alias or to_camel(n)) for n, f in cls.model_fields.items())
+    return {k: getattr(obj, n) for n, k in keys}
+
+def _default(obj):
+    """Types neither encoder knows: Model rows are read straight off their
+    attributes (no validation pass), other models go through model_dump."""
+    if isinstance(obj, BaseModel):
+        if getattr(type(obj), '__table__', None) is not None:
+            return _row(obj)
+        return obj.model_dump(mode='json', by_alias=True)
+    if isinstance(obj, (datetime, date, time)): return obj.isoformat()
+    if isinstance(obj, Decimal): return float(obj)
+    if isinstance(obj, Enum): return obj.value
+    if isinstance(obj, UUID): return str(obj)
+    if isinstance(obj, (set, frozenset)): return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+_ORJSON_OPTS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that encodes with orjson when installed (brackets[web]) and
+    serializes Model rows, datetimes, Decimals and UUIDs itself, so returning
+    it skips FastAPI's jsonable_encoder."""
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=_ORJSON_OPTS)
+        return _json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                           separators=(',', ':')).encode('utf-8')
 
 def json(data: Any, **opts):
-    return JSONResponse(data, **opts)
+    return FastJSONResponse(data, **opts)
 
 def redirect(to: str):
     return RedirectResponse(to, status_code=303)
 
 def toast(message: str):
-    return JSONResponse({"brx": {"toast": message}})
+    return FastJSONResponse({"brx": {"toast": message}})
 
 def reload():
-    return JSONResponse({"brx": {"reload": True}})
+    return FastJSONResponse({"brx": {"reload": True}})
@@ -1,25 +1,172 @@
-import time
-from fastapi import Request, HTTPException
-from functools import wraps
+from __future__ import annotations
+import functools, inspect, math, re, threading, time
+from typing import Callable, Optional
+from fastapi import Request, Response, HTTPException
+from starlette.requests import HTTPConnection
+from . import cache as _cache
 
-_buckets = {}
+# Token bucket in its GCRA form: per key we only store the "theoretical
+# arrival time" (tat) at which the bucket is full again. A request costs
+# `interval` = window/n seconds and is let through while tat stays within
+# `window` of now, so up to n requests can burst and then refill evenly.
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+_SPEC_RE = re.compile(r'\s*(\d+)\s*/\s*(\d*)\s*([smhd])\s*')
+_PREFIX = 'brx:rl:'
+
+# Redis's clock, so every worker agrees on "now".
+_GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local interval, window = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then tat = now end
+local new = tat + interval
+if new - now > window then
+  return {0, tostring(new - window - now), tostring(tat - now)}
+end
+redis.call('SET', KEYS[1], tostring(new), 'PX', math.ceil((new - now) * 1000))
+return {1, '0', tostring(new - now)}
+"""
+
+class _MemoryLimits:
+    """tat per key; keys whose bucket is full again are swept periodically."""
+    def __init__(self, sweep_interval: float = 60.0):
+        self._tat: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def hit(self, key: str, interval: float, window: float) -> tuple[bool, float, float]:
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._tat = {k: t for k, t in self._tat.items() if t > now}
+                self._next_sweep = now + self.sweep_interval
+            tat = max(self._tat.get(key, now), now)
+            new = tat + interval
+            if new - now > window:
+                return False, new - window - now, tat - now
+            self._tat[key] = new
+            return True, 0.0, new - now
+
+    def __len__(self):
+        return len(self._tat)
+
+_mem = _MemoryLimits()
+_scripts: dict = {}  # id(client) -> (client, registered GCRA script)
+
+def _script(client):
+    hit = _scripts.get(id(client))
+    if hit is None or hit[0] is not client:
+        hit = _scripts[id(client)] = (client, client.register_script(_GCRA_LUA))
+    return hit[1]
+
+def _parse(spec: str) -> tuple[int, float]:
+    # '60/m' -> 60 per 60s, '10/5s' -> 10 per 5s
+    m = _SPEC_RE.fullmatch(spec)
+    if not m:
+        raise RuntimeError(f"bad rate limit {spec!r}; expected e.g. '60/m', '10/5s', '1000/h'")
+    n, mult, unit = m.groups()
+    return int(n), int(mult or 1) * _UNITS[unit]
+
+def _client_key(request: Request) -> str:
+    return request.client.host if request.client else 'anon'
+
+def _headers(n: int, interval: float, window: float, ok: bool, retry: float, used: float) -> dict:
+    h = {
+        'X-RateLimit-Limit': str(n),
+        'X-RateLimit-Remaining': str(max(0, int((window - used) // interval)) if ok else 0),
+        'X-RateLimit-Reset': str(math.ceil(used)),
+    }
+    if not ok:
+        h['Retry-After'] = str(max(1, math.ceil(retry)))
+    return h
+
+def _signature(fn: Callable) -> inspect.Signature:
+    try:
+        return inspect.signature(fn, eval_str=True)
+    except Exception:
+        return inspect.signature(fn)
+
+def _own_param(sig: inspect.Signature, base: type) -> Optional[str]:
+    # FastAPI fills one Request and one Response per route; reuse the handler's own
+    for p in sig.parameters.values():
+        if isinstance(p.annotation, type) and issubclass(p.annotation, base):
+            return p.name
+    return None
+
+def _with_request(sig: inspect.Signature, wrapper: Callable, req: Optional[str], resp: Optional[str]) -> Callable:
+    # FastAPI injects Request/Response for the extra parameters the handler
+    # lacks; the wrapper pops them, so the handler keeps its own signature.
+    params = [p for p in sig.parameters.values() if p.kind != p.VAR_KEYWORD]
+    extra = ([] if req else [inspect.Parameter('_brx_request', inspect.Parameter.KEYWORD_ONLY, annotation=Request)]) + \
+            ([] if resp else [inspect.Parameter('_brx_response', inspect.Parameter.KEYWORD_ONLY, annotation=Response)])
+    tail = [p for p in sig.parameters.values() if p.kind == p.VAR_KEYWORD]
+    wrapper.__signature__ = sig.replace(parameters=params + extra + tail)
+    return wrapper
+
+def limit(spec: str, *, key: Optional[Callable[[Request], str]] = None):
+    """Rate-limit a route: `@limit('100/m')`, `'10/5s'`, `'1000/h'`, `'5000/d'`.
+
+    A token bucket per client (the client IP, or `key(request)`): up to n
+    requests at once, refilling evenly over the window. Over the limit the
+    route answers 429 with Retry-After; every response carries
+    X-RateLimit-Limit/Remaining/Reset. Buckets live in Redis when useCache()
+    points at Redis (an atomic Lua script, shared by all workers), otherwise
+    in process memory where full buckets are swept away.
+    Works on sync and `async def` handlers.
+    """
+    n, window = _parse(spec)
+    interval = window / n
+    key_fn = key or _client_key
 
-def limit(spec: str):
-    # '60/m' -> (60, 60) requests per 60s
-    count, per = spec.split('/')
-    n = int(count)
-    window = {'s':1,'m':60,'h':3600}[per]
     def deco(fn):
-        @wraps(fn)
+        name = f'{_PREFIX}{fn.__module__}.{fn.__qualname__}:'
+        sig = _signature(fn)
+        req, resp = _own_param(sig, HTTPConnection), _own_param(sig, Response)
+
+        def _injected(kw) -> tuple:
+            return (kw[req] if req else kw.pop('_brx_request'),
+                    kw[resp] if resp else kw.pop('_brx_response'))
+
+        def _check(ok, retry, used) -> dict:
+            headers = _headers(n, interval, window, ok, retry, used)
+            if not ok:
+                raise HTTPException(status_code=429, detail='Too many requests', headers=headers)
+            return headers
+
+        def _finish(headers, response, result):
+            # headers go on the injected Response, or straight on one the handler returned
+            (result if isinstance(result, Response) else response).headers.update(headers)
+            return result
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*a, **kw):
+                request, response = _injected(kw)
+                k = name + key_fn(request)
+                client = _cache._backend.get('aclient')
+                if client is not None:
+                    ok, retry, used = await _script(client)(keys=[k], args=[interval, window])
+                    ok, retry, used = bool(ok), float(retry), float(used)
+                else:
+                    ok, retry, used = _mem.hit(k, interval, window)
+                headers = _check(ok, retry, used)
+                return _finish(headers, response, await fn(*a, **kw))
+            return _with_request(sig, awrapper, req, resp)
+
+        @functools.wraps(fn)
         def wrapper(*a, **kw):
-            req: Request = kw.get('request') or (a[0] if a and hasattr(a[0],'headers') else None)
-            ip = req.client.host if req else 'anon'
-            now = int(time.time()/window)
-            key = (ip, fn.__name__, now)
-            c = _buckets.get(key, 0) + 1
-            _buckets[key] = c
-            if c > n:
-                raise HTTPException(status_code=429, detail='Too many requests')
-            return fn(*a, **kw)
-        return wrapper
+            request, response = _injected(kw)
+            k = name + key_fn(request)
+            client = _cache._backend.get('client')
+            if client is not None:
+                ok, retry, used = _script(client)(keys=[k], args=[interval, window])
+                ok, retry, used = bool(ok), float(retry), float(used)
+            else:
+                ok, retry, used = _mem.hit(k, interval, window)
+            headers = _check(ok, retry, used)
+            return _finish(headers, response, fn(*a, **kw))
+        return _with_request(sig, wrapper, req, resp)
     return deco
@@ -0,0 +1,89 @@
+from __future__ import annotations
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from . import cache, events
+from .plugins import usePlugin, _plugins
+
+_router = APIRouter()
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_PHASES = ('total', 'middleware', 'handler', 'compile', 'render')
+
+class RequestTimings:
+    """Built-in plugin: latency histograms per route and phase, plus a
+    Server-Timing header so browser devtools show where a request's time went."""
+    def __init__(self, server_timing: bool = True):
+        self.server_timing = server_timing
+        # (route, phase) -> [per-bucket counts (last is +Inf), sum, count]
+        self.hist: dict[tuple[str, str], list] = {}
+
+    def observe(self, route: str, phase: str, seconds: float):
+        h = self.hist.get((route, phase))
+        if h is None:
+            h = self.hist[(route, phase)] = [[0] * (len(_BUCKETS) + 1), 0.0, 0]
+        i = next((i for i, b in enumerate(_BUCKETS) if seconds <= b), len(_BUCKETS))
+        h[0][i] += 1; h[1] += seconds; h[2] += 1
+
+    def onResponse(self, request, status, headers, timings):
+        # the matched route's pattern, never the raw path, to keep label cardinality bounded
+        route = getattr(request.scope.get('route'), 'path', None) or 'unmatched'
+        for phase in _PHASES:
+            if phase in timings:
+                self.observe(route, phase, timings[phase])
+        if self.server_timing:
+            headers.append('Server-Timing', ', '.join(
+                f'{p};dur={timings[p] * 1000:.2f}' for p in _PHASES if p in timings))
+
+_timings: RequestTimings | None = None
+
+def _label(v: str) -> str:
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _counter(lines: list[str], name: str, help: str, samples: list[tuple[dict, float]]):
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} counter')
+    for labels, v in samples:
+        ls = ','.join(f'{k}="{_label(x)}"' for k, x in labels.items())
+        lines.append(f'{name}{{{ls}}} {v}' if ls else f'{name} {v}')
+
+def render() -> str:
+    """Prometheus text exposition (format 0.0.4) of the cache counters."""
+    m, lines = cache.metrics(), []
+    for scope in ('prefix', 'tag'):
+        by = m[scope]
+        _counter(lines, f'brx_cache_{scope}_requests_total', f'Cache lookups per {scope} by result.',
+                 [({scope: n, 'result': r}, c[r]) for n, c in sorted(by.items()) for r in ('hit', 'miss', 'stale')])
+        _counter(lines, f'brx_cache_{scope}_computes_total', f'Cached function executions per {scope}.',
+                 [({scope: n}, c['compute']) for n, c in sorted(by.items())])
+        _counter(lines, f'brx_cache_{scope}_compute_seconds_total', f'Time spent computing cached values per {scope}.',
+                 [({scope: n}, c['compute_seconds']) for n, c in sorted(by.items())])
+    _counter(lines, 'brx_cache_coalesced_total', 'Misses served by another caller\'s computation.',
+             [({}, cache.stats()['coalesced'])])
+    ev = events.stats()
+    _counter(lines, 'brx_events_total', 'Client events posted to /bx/event by outcome.',
+             [({'result': r}, ev[r]) for r in ('accepted', 'dropped', 'dispatched', 'errors')])
+    _counter(lines, 'brx_event_batches_total', 'Event batches handed to handlers.', [({}, ev['batches'])])
+    if _timings is not None:
+        _histogram(lines, 'brx_request_duration_seconds', 'Request time per route and phase.', _timings.hist)
+    return '\n'.join(lines) + '\n'
+
+def _histogram(lines: list[str], name: str, help: str, hist: dict):
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} histogram')
+    for (route, phase), (counts, total, n) in sorted(hist.items()):
+        ls = f'route="{_label(route)}",phase="{phase}"'
+        acc = 0
+        for b, c in zip((*_BUCKETS, '+Inf'), counts):
+            acc += c
+            lines.append(f'{name}_bucket{{{ls},le="{b}"}} {acc}')
+        lines.append(f'{name}_sum{{{ls}}} {total}')
+        lines.append(f'{name}_count{{{ls}}} {n}')
+
+@_router.get('/bx/metrics')
+def metrics():
+    return PlainTextResponse(render(), media_type='text/plain; version=0.0.4')
+
+def mount_metrics(app):
+    global _timings
+    app.include_router(_router)
+    if _timings is None or _timings not in _plugins:
+        _timings = usePlugin(RequestTimings())
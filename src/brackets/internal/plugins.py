@@ -1,15 +1,94 @@
+from __future__ import annotations
+import contextvars
+from time import perf_counter
+
 _plugins = []
+# hook name -> handlers, rebuilt by usePlugin so emitting never scans plugins
+_hooks: dict[str, list] = {}
+_LIFECYCLE = ('onRequest', 'onResponse', 'onError')
+
+# Per-request phase timings in seconds, set by LifecycleMiddleware:
+# total, middleware, handler, compile, render.
+_timings: contextvars.ContextVar[dict | None] = contextvars.ContextVar('brx_timings', default=None)
 
 def usePlugin(plugin):
+    """Register a plugin: any object with onRequest/onResponse/onRender/onError/onCache methods.
+
+    onRequest(request)                                 before the app runs
+    onResponse(request, status, headers, timings)      as the response starts; headers are mutable
+    onError(request, exc)                              an exception escaped the app
+    onRender(template, seconds, *, compile_seconds)    after each Env.render
+    """
     _plugins.append(plugin)
+    _rebuild()
     return plugin
 
-def _emit(name, *a, **kw):
+def _rebuild():
+    _hooks.clear()
     for p in _plugins:
-        h = getattr(p, name, None)
-        if callable(h):
-            try:
-                h(*a, **kw)
-            except Exception as e:
-                # plugin errors shouldn't crash the app
-                pass
+        for name in dir(p):
+            if name.startswith('on') and callable(h := getattr(p, name)):
+                _hooks.setdefault(name, []).append(h)
+
+def _emit(name, *a, **kw):
+    for h in _hooks.get(name, ()):
+        try:
+            h(*a, **kw)
+        except Exception as e:
+            # plugin errors shouldn't crash the app
+            pass
+
+def _track(phase: str, seconds: float):
+    t = _timings.get()
+    if t is not None:
+        t[phase] = t.get(phase, 0.0) + seconds
+
+class LifecycleMiddleware:
+    """Outermost middleware: emits onRequest/onResponse/onError and times the request.
+
+    Does nothing beyond a dict lookup unless a plugin has a lifecycle hook.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not any(n in _hooks for n in _LIFECYCLE):
+            return await self.app(scope, receive, send)
+        from starlette.datastructures import MutableHeaders
+        from starlette.requests import Request
+        request = Request(scope, receive)
+        timings = {}
+        token = _timings.set(timings)
+        start = perf_counter()
+        _emit('onRequest', request)
+
+        async def send_timed(message):
+            if message['type'] == 'http.response.start':
+                timings['total'] = perf_counter() - start
+                timings['middleware'] = max(0.0, timings['total'] - timings.get('handler', timings['total']))
+                _emit('onResponse', request, message['status'], MutableHeaders(scope=message), timings)
+            await send(message)
+        try:
+            await self.app(scope, receive, send_timed)
+        except Exception as exc:
+            _emit('onError', request, exc)
+            raise
+        finally:
+            _timings.reset(token)
+
+class HandlerTimer:
+    """Innermost middleware: time from routing to the response starting."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        t = _timings.get()
+        if t is None:
+            return await self.app(scope, receive, send)
+        start = perf_counter()
+
+        async def send_timed(message):
+            if message['type'] == 'http.response.start' and 'handler' not in t:
+                t['handler'] = perf_counter() - start
+            await send(message)
+        await self.app(scope, receive, send_timed)
@@ -1,23 +1,256 @@
 from __future__ import annotations
-import hashlib, os
-from typing import Any
-from jinja2 import Environment, FileSystemLoader, Template
+import hashlib, json, os, shutil, threading
+from time import monotonic, perf_counter
+from typing import Any, Iterable, Iterator
+from jinja2 import (BaseLoader, Environment, FileSystemBytecodeCache, FileSystemLoader,
+                    Template, TemplateNotFound, TemplateSyntaxError)
+from jinja2.loaders import split_template_path
 from .dsl import compile_bx
+from .plugins import _emit, _track
+
+BX_SUFFIXES = ('.bx', '.bxc')
+BUILD_TEMPLATES = 'templates'
+BUILD_BYTECODE = 'bytecode'
+BUILD_MANIFEST = 'manifest.json'
+STREAM_BUFFER = 8192  # chars per streamed chunk
+MISSING_RECHECK = 1.0  # seconds a dev (auto_reload) Env trusts a cached 'no such template'
+
+class BxLoader(BaseLoader):
+    """Filesystem loader that runs .bx/.bxc sources through compile_bx.
+
+    Jinja calls get_source only when a template is not in its cache (or is
+    stale), so every call here is a cache miss; `_tl.loaded` lets Env.render
+    attribute hits/misses per thread. compat=False compiles with the opt-in
+    corrected compiler (see dsl.compile_bx).
+    """
+    def __init__(self, searchpath: str, *, compat: bool = True):
+        self.searchpath = searchpath
+        self.compat = compat
+        self._tl = threading.local()
+
+    def get_source(self, environment: Environment, template: str):
+        path = os.path.join(self.searchpath, *split_template_path(template))
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                src = f.read()
+        except OSError:
+            raise TemplateNotFound(template)
+        if path.endswith(BX_SUFFIXES):
+            src = compile_bx(src, compat=self.compat)
+        self._tl.loaded = True
+
+        def uptodate() -> bool:
+            try:
+                return os.path.getmtime(path) == mtime
+            except OSError:
+                return False
+        return src, path, uptodate
+
+class _BuildLoader(FileSystemLoader):
+    """Loads precompiled Jinja sources from a `brx build` artifact."""
+    def __init__(self, searchpath: str):
+        super().__init__(searchpath)
+        self._tl = threading.local()
+
+    def get_source(self, environment: Environment, template: str):
+        src = super().get_source(environment, template)
+        self._tl.loaded = True
+        return src
+
+class _BuildBytecodeCache(FileSystemBytecodeCache):
+    """Bytecode cache keyed by template name only, so the artifact survives
+    being copied to another path (e.g. into a container image)."""
+    def get_cache_key(self, name: str, filename: str | None = None) -> str:
+        return super().get_cache_key(name)
+
+def _iter_templates(root: str, suffixes: tuple[str, ...] | None = BX_SUFFIXES):
+    # suffixes=None: every file, for the {% include %}/{% extends %} targets of .bx pages
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for fname in sorted(filenames):
+            if suffixes is None and not fname.startswith('.') or suffixes and fname.endswith(suffixes):
+                full = os.path.join(dirpath, fname)
+                yield os.path.relpath(full, root).replace(os.sep, '/'), full
+
+def build(templates_dir: str, out_dir: str, *, compat: bool = True) -> list[str]:
+    """Compile every .bx/.bxc under templates_dir into out_dir.
+
+    Writes the compiled Jinja sources, a Jinja bytecode cache for them and a
+    manifest; `Env(build_dir=out_dir)` then loads only from this artifact.
+    Other files (plain Jinja partials a .bx page includes or extends) are
+    copied as they are and bytecode-compiled when they parse as templates.
+    `compat` is passed to compile_bx.
+    """
+    src_root = os.path.join(out_dir, BUILD_TEMPLATES)
+    bc_root = os.path.join(out_dir, BUILD_BYTECODE)
+    for d in (src_root, bc_root):
+        shutil.rmtree(d, ignore_errors=True)
+    os.makedirs(bc_root)
+    bx, other = [], []
+    for name, full in _iter_templates(templates_dir, None):
+        dest = os.path.join(src_root, *name.split('/'))
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if not name.endswith(BX_SUFFIXES):
+            shutil.copyfile(full, dest); other.append(name)
+            continue
+        with open(full, 'r', encoding='utf-8') as f:
+            compiled = compile_bx(f.read(), compat=compat)
+        with open(dest, 'w', encoding='utf-8') as f:
+            f.write(compiled)
+        bx.append(name)
+    jinja = Environment(loader=FileSystemLoader(src_root), autoescape=True,
+                        bytecode_cache=_BuildBytecodeCache(bc_root))
+    for name in bx:
+        jinja.get_template(name)
+    names = list(bx)
+    for name in other:
+        try:
+            jinja.get_template(name)
+        except (TemplateSyntaxError, UnicodeDecodeError):
+            continue  # not a template (an image, a stray asset): shipped, never warmed
+        names.append(name)
+    with open(os.path.join(out_dir, BUILD_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({'templates': names}, f, indent=2)
+    return names
+
+def coalesce(parts: Iterable[str], size: int = STREAM_BUFFER) -> Iterator[str]:
+    """Join the many small strings Jinja yields into chunks of at least `size` chars."""
+    buf: list[str] = []; n = 0
+    for p in parts:
+        buf.append(p); n += len(p)
+        if n >= size:
+            yield ''.join(buf); buf.clear(); n = 0
+    if buf:
+        yield ''.join(buf)
 
 class Env:
-    def __init__(self, templates_dir: str | None = None):
+    def __init__(self, templates_dir: str | None = None, *, auto_reload: bool = True,
+                 cache_size: int = 400, build_dir: str | None = None, bx_compat: bool = True):
         self.templates_dir = templates_dir or os.getcwd()
-        self.jinja = Environment(loader=FileSystemLoader(self.templates_dir), autoescape=True)
+        self.build_dir = build_dir
+        self.bx_compat = bx_compat
+        if build_dir:
+            # Prod: precompiled sources + bytecode only, never revalidated.
+            self.loader = _BuildLoader(os.path.join(build_dir, BUILD_TEMPLATES))
+            self.jinja = Environment(loader=self.loader, autoescape=True, auto_reload=False,
+                                     cache_size=cache_size,
+                                     bytecode_cache=_BuildBytecodeCache(os.path.join(build_dir, BUILD_BYTECODE)))
+        else:
+            self.loader = BxLoader(self.templates_dir, compat=bx_compat)
+            # Jinja keeps compiled Template objects in a bounded LRU keyed by name;
+            # auto_reload revalidates via the loader's mtime check (dev), off in prod.
+            self.jinja = Environment(loader=self.loader, autoescape=True,
+                                     auto_reload=auto_reload, cache_size=cache_size)
+        self.hits = 0
+        self.misses = 0
+        self._missing: dict[str, float] = {}  # name -> when has_template() last failed to find it
+
+    def get_template(self, template: str) -> Template:
+        self.loader._tl.loaded = False
+        tpl = self.jinja.get_template(template)
+        if self.loader._tl.loaded:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return tpl
+
+    def _timed_template(self, template: str) -> tuple[Template, float]:
+        t0 = perf_counter()
+        tpl = self.get_template(template)
+        # lookups that hit the cache cost microseconds; only misses count as compile time
+        compile_s = perf_counter() - t0 if self.loader._tl.loaded else 0.0
+        if compile_s:
+            _track('compile', compile_s)
+        return tpl, compile_s
+
+    def _rendered(self, template: str, seconds: float, compile_s: float):
+        _track('render', seconds)
+        _emit('onRender', template, seconds, compile_seconds=compile_s)
 
     def render(self, template: str, **ctx: Any) -> str:
-        path = os.path.join(self.templates_dir, template)
-        with open(path, 'r', encoding='utf-8') as f:
-            src = f.read()
-        compiled = compile_bx(src)
-        tpl: Template = self.jinja.from_string(compiled)
+        tpl, compile_s = self._timed_template(template)
+        t0 = perf_counter()
         html = tpl.render(**ctx)
+        self._rendered(template, perf_counter() - t0, compile_s)
+        return html
+
+    def stream(self, template: str, /, *, _buffer: int = STREAM_BUFFER, **ctx: Any) -> Iterator[str]:
+        """Render via Jinja's generate(), yielding chunks of about `_buffer` chars.
+
+        The template is looked up eagerly so a missing one raises here, before
+        any response has started. Render time (time spent producing chunks, not
+        waiting on the client) is reported once the stream ends.
+        """
+        tpl, compile_s = self._timed_template(template)
+        return self._timed_stream(template, coalesce(tpl.generate(**ctx), _buffer), compile_s)
+
+    def _timed_stream(self, template: str, chunks: Iterator[str], compile_s: float) -> Iterator[str]:
+        busy = 0.0
+        try:
+            while True:
+                t0 = perf_counter()
+                chunk = next(chunks, None)
+                busy += perf_counter() - t0
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self._rendered(template, busy, compile_s)
+
+    def render_block(self, template: str, block: str, **ctx: Any) -> str:
+        """Render one named `{% block %}` of a template, without its parents."""
+        tpl, compile_s = self._timed_template(template)
+        try:
+            fn = tpl.blocks[block]
+        except KeyError:
+            raise RuntimeError(f"template {template!r} has no block {block!r}") from None
+        t0 = perf_counter()
+        html = ''.join(fn(tpl.new_context(ctx)))
+        self._rendered(template, perf_counter() - t0, compile_s)
         return html
 
+    def has_template(self, template: str) -> bool:
+        # misses are remembered so an absent layout doesn't cost a filesystem lookup per
+        # request; with auto_reload they're rechecked now and then to notice new files
+        missed = self._missing.get(template)
+        if missed is not None and (not self.jinja.auto_reload or monotonic() - missed < MISSING_RECHECK):
+            return False
+        try:
+            self._timed_template(template)
+        except TemplateNotFound:
+            self._missing[template] = monotonic()
+            return False
+        self._missing.pop(template, None)
+        return True
+
+    def warm(self) -> int:
+        """Load every template (from the build manifest when there is one) into
+        the cache; returns how many were loaded."""
+        if self.build_dir:
+            with open(os.path.join(self.build_dir, BUILD_MANIFEST), encoding='utf-8') as f:
+                names = json.load(f)['templates']
+        else:
+            names = [name for name, _ in _iter_templates(self.templates_dir)]
+        for name in names:
+            self._timed_template(name)
+        return len(names)
+
+    def cache_info(self) -> dict:
+        cache = self.jinja.cache
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(cache) if cache is not None else 0,
+            'maxsize': getattr(cache, 'capacity', 0),
+        }
+
+    def cache_clear(self):
+        if self.jinja.cache is not None:
+            self.jinja.cache.clear()
+        self._missing.clear()
+        self.hits = self.misses = 0
+
     @staticmethod
     def etag_for(html: str) -> str:
         return hashlib.sha256(html.encode('utf-8')).hexdigest()
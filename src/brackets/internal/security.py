@@ -1,33 +1,100 @@
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from __future__ import annotations
+from urllib.parse import parse_qsl
+from fastapi import Response
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import Headers
+from starlette.requests import cookie_parser
 from itsdangerous import URLSafeSerializer
 
 CSRF_COOKIE = 'csrf'
 CSRF_FORM = 'csrf'
 CSRF_HEADER = 'X-CSRFToken'
+CSRF_MAX_BODY = 64 * 1024  # bytes of a form body scanned for the token
+# sendBeacon can't set headers and the cookie is HttpOnly; events are fire-and-forget
+CSRF_EXEMPT = ('/bx/event',)
 
-class CSRFMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, *, secret: str = 'csrf-secret'):
-        super().__init__(app)
-        self.ser = URLSafeSerializer(secret, salt='brx.csrf')
-
-    async def dispatch(self, request: Request, call_next):
-        csrf = request.cookies.get(CSRF_COOKIE)
-        if not csrf:
-            csrf = self.ser.dumps('ok')
-            request.state._issue_csrf = csrf
-        if request.method in {'POST','PUT','PATCH','DELETE'}:
-            token = request.headers.get(CSRF_HEADER)
+_UNSAFE = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+
+def _form_token(body: bytes, content_type: str, complete: bool) -> str | None:
+    """Find the csrf field in a (possibly partial) form body without parsing the whole form."""
+    ctype, _, params = content_type.partition(';')
+    ctype = ctype.strip().lower()
+    if ctype == 'application/x-www-form-urlencoded':
+        if not complete:
+            body = body[:body.rfind(b'&') + 1]  # drop a field that may be cut off
+        for k, v in parse_qsl(body.decode('latin-1'), keep_blank_values=True):
+            if k == CSRF_FORM:
+                return v
+    elif ctype == 'multipart/form-data':
+        boundary = next((p.split('=', 1)[1].strip().strip('"') for p in params.split(';')
+                         if p.strip().lower().startswith('boundary=')), None)
+        if not boundary:
+            return None
+        start = body.find(f'name="{CSRF_FORM}"'.encode())
+        start = body.find(b'\r\n\r\n', start) if start != -1 else -1
+        end = body.find(b'\r\n--' + boundary.encode(), start) if start != -1 else -1
+        if end != -1:
+            return body[start + 4:end].decode('utf-8', 'replace')
+    return None
+
+class CSRFMiddleware:
+    """Double-submit CSRF check as a plain ASGI middleware.
+
+    Unsafe methods must echo the `csrf` cookie in the X-CSRFToken header or a
+    `csrf` form field (paths in `exempt` skip the check). Only the first `max_body` bytes of a form are read to
+    find the field; whatever was read is replayed to the app unchanged.
+    """
+    def __init__(self, app, *, secret: str = 'csrf-secret', max_body: int = CSRF_MAX_BODY,
+                 exempt: tuple[str, ...] = CSRF_EXEMPT):
+        self.app = app
+        self.max_body = max_body
+        self.exempt = frozenset(exempt)
+        # the signed value is deterministic, so sign once instead of per request
+        self.token = URLSafeSerializer(secret, salt='brx.csrf').dumps('ok')
+        r = Response(); r.set_cookie(CSRF_COOKIE, self.token, httponly=True, samesite='lax')
+        self._set_cookie = next(h for h in r.raw_headers if h[0] == b'set-cookie')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        csrf = cookie_parser(headers.get('cookie', '')).get(CSRF_COOKIE)
+        issue = not csrf
+        if issue:
+            csrf = self.token
+        if scope['method'] in _UNSAFE and scope['path'] not in self.exempt:
+            token = headers.get(CSRF_HEADER)
             if token is None:
-                try:
-                    form = await request.form()
-                    token = form.get(CSRF_FORM)
-                except Exception:
-                    token = None
+                token, receive = await self._read_token(headers.get('content-type', ''), receive)
             if not token or token != csrf:
-                from fastapi.responses import PlainTextResponse
-                return PlainTextResponse('CSRF failed', status_code=403)
-        response: Response = await call_next(request)
-        if getattr(request.state, '_issue_csrf', None):
-            response.set_cookie(CSRF_COOKIE, csrf, httponly=True, samesite='lax')
-        return response
+                return await PlainTextResponse('CSRF failed', status_code=403)(scope, receive, send)
+        if issue:
+            send = self._issue(send)
+        await self.app(scope, receive, send)
+
+    async def _read_token(self, content_type: str, receive):
+        if not content_type.lower().startswith(('application/x-www-form-urlencoded', 'multipart/form-data')):
+            return None, receive
+        messages, body, more = [], b'', True
+        while more and len(body) < self.max_body:
+            msg = await receive()
+            messages.append(msg)
+            if msg['type'] != 'http.request':
+                break
+            body += msg.get('body', b'')
+            more = msg.get('more_body', False)
+        token = _form_token(body[:self.max_body], content_type, not more and len(body) <= self.max_body)
+
+        pending = iter(messages)
+        async def replay():
+            for msg in pending:
+                return msg
+            return await receive()
+        return token, replay
+
+    def _issue(self, send):
+        async def send_with_cookie(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []), self._set_cookie]
+            await send(message)
+        return send_with_cookie
@@ -1,26 +1,212 @@
-import asyncio
-from typing import Dict
-from fastapi import APIRouter
+from __future__ import annotations
+import asyncio, os, time
+from collections import deque
+from typing import Dict, Optional
+from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
+from . import cache as _cache
 
-_channels: Dict[str, asyncio.Queue[str]] = {}
+# Pub/sub hub: each connection owns a bounded queue; a broadcast is formatted
+# once and put on every subscriber's queue of that channel.
+_config = {"queue_size": 256, "history": 100, "heartbeat": 15.0, "slow": "drop", "idle_ttl": 60.0}
+_channels: Dict[str, "_Channel"] = {}
+_stats = {"dropped": 0, "disconnected": 0}
+_CLOSE = None  # queued to make a slow subscriber's stream end
 
-async def _publisher(channel: str):
-    q = _channels.setdefault(channel, asyncio.Queue())
-    while True:
-        msg = await q.get()
-        yield f"data: {msg}\n\n"
+_PREFIX = "brx:sse:"          # pub/sub channel per SSE channel
+_SEQ_PREFIX = "brx:sse-seq:"  # event id counter per SSE channel
+# Number and publish in one step so every worker sees ids in publish order.
+_PUBLISH_LUA = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], 86400)
+redis.call('PUBLISH', ARGV[1], seq .. ':' .. ARGV[2])
+return seq
+"""
+
+class _LocalBroker:
+    """Default: broadcast reaches the clients of this process only."""
+    name = "local"
+    async def publish(self, channel: str, message: str):
+        _fanout(channel, message)
+    def watch(self):
+        pass
+
+class _RedisBroker:
+    """Broadcast through Redis pub/sub. Each worker holds one pattern
+    subscription and fans messages out to its own connections."""
+    name = "redis"
+    def __init__(self, client):
+        self.client = client
+        self._publish = client.register_script(_PUBLISH_LUA)
+        self._task: Optional[asyncio.Task] = None
+        self._pid: Optional[int] = None
+
+    async def publish(self, channel: str, message: str):
+        await self._publish(keys=[_SEQ_PREFIX + channel], args=[_PREFIX + channel, str(message)])
+
+    def watch(self):
+        # started by the first local subscriber; one listener per process and loop
+        loop = asyncio.get_running_loop()
+        if (self._task is None or self._task.done() or self._pid != os.getpid()
+                or self._task.get_loop() is not loop):
+            self._pid = os.getpid()
+            self._task = loop.create_task(self._listen())
+
+    async def _listen(self):
+        delay = 0.1
+        while True:
+            ps = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await ps.psubscribe(_PREFIX + "*")
+                delay = 0.1
+                async for m in ps.listen():
+                    if m["type"] != "pmessage":
+                        continue
+                    channel, data = m["channel"], m["data"]
+                    if isinstance(channel, bytes): channel = channel.decode()
+                    if isinstance(data, bytes): data = data.decode()
+                    seq, _, message = data.partition(":")
+                    _fanout(channel[len(_PREFIX):], message, int(seq))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await asyncio.sleep(delay); delay = min(delay * 2, 5.0)
+            finally:
+                await ps.reset()
+
+_broker = _LocalBroker()
+
+class _Channel:
+    __slots__ = ("subs", "history", "seq", "idle_since")
+    def __init__(self, history: int):
+        self.subs: set[asyncio.Queue] = set()
+        self.history: deque[tuple[int, str]] = deque(maxlen=history)  # (id, frame) for Last-Event-ID replay
+        self.seq = 0
+        self.idle_since: Optional[float] = None
+
+def useSSE(*, queue_size: int = 256, history: int = 100, heartbeat: float = 15.0,
+           slow: str = "drop", idle_ttl: float = 60.0, broker: str = "local"):
+    """Tune /bx/sse.
+
+    Each connection buffers at most `queue_size` messages. When a client falls
+    behind, `slow='drop'` discards its oldest message and `slow='disconnect'`
+    closes its stream (EventSource reconnects and replays via Last-Event-ID).
+    The last `history` messages per channel are kept for that replay, and a
+    channel without subscribers is forgotten after `idle_ttl` seconds.
+    A comment line goes out every `heartbeat` seconds to keep proxies from
+    timing out idle streams.
+
+    `broker='redis'` sends broadcasts through Redis pub/sub so they reach
+    every worker, using the connection configured by useCache(); a redis://
+    URL uses that server instead. The default 'local' stays in-process.
+    """
+    global _broker
+    if slow not in ("drop", "disconnect"):
+        raise RuntimeError("useSSE(slow=...) must be 'drop' or 'disconnect'")
+    if broker == "local":
+        _broker = _LocalBroker()
+    elif broker == "redis":
+        if _cache._backend.get("aclient") is None:
+            raise RuntimeError("useSSE(broker='redis') needs a Redis cache; call useCache('redis://...') first")
+        _broker = _RedisBroker(_cache._backend["aclient"])
+    elif broker.startswith("redis://"):
+        if _cache.aredis is None:
+            raise RuntimeError("redis extra not installed; pip install brackets[cache]")
+        _broker = _RedisBroker(_cache.aredis.Redis.from_url(broker))
+    else:
+        raise RuntimeError(f"unknown SSE broker: {broker!r}")
+    _config.update(queue_size=queue_size, history=history, heartbeat=heartbeat, slow=slow, idle_ttl=idle_ttl)
+
+def _frame(seq: int, message: str) -> str:
+    data = "\n".join("data: " + line for line in str(message).split("\n"))
+    return f"id: {seq}\n{data}\n\n"
+
+def _sweep(now: float):
+    ttl = _config["idle_ttl"]
+    for name in [n for n, ch in _channels.items() if ch.idle_since is not None and now - ch.idle_since > ttl]:
+        del _channels[name]
+
+def _deliver(q: asyncio.Queue, frame: str):
+    try:
+        q.put_nowait(frame); return
+    except asyncio.QueueFull:
+        pass
+    if _config["slow"] == "disconnect":
+        while not q.empty(): q.get_nowait()
+        q.put_nowait(_CLOSE); _stats["disconnected"] += 1
+    else:
+        q.get_nowait(); q.put_nowait(frame); _stats["dropped"] += 1
+
+def _fanout(channel: str, message: str, seq: Optional[int] = None):
+    ch = _channels.get(channel)
+    if ch is None:
+        return  # nobody listening here and nothing worth replaying
+    ch.seq = seq if seq is not None else ch.seq + 1
+    frame = _frame(ch.seq, message)
+    ch.history.append((ch.seq, frame))
+    for q in tuple(ch.subs):
+        _deliver(q, frame)
 
 async def broadcast(channel: str, message: str):
-    q = _channels.setdefault(channel, asyncio.Queue())
-    await q.put(message)
+    """Send `message` to every client subscribed to `channel` (in every worker
+    with a shared broker)."""
+    await _broker.publish(channel, message)
+
+def _subscribe(channel: str) -> tuple[_Channel, asyncio.Queue]:
+    _sweep(time.monotonic())
+    ch = _channels.get(channel)
+    if ch is None:
+        ch = _channels[channel] = _Channel(_config["history"])
+    q: asyncio.Queue = asyncio.Queue(_config["queue_size"])
+    ch.subs.add(q); ch.idle_since = None
+    _broker.watch()
+    return ch, q
+
+def _unsubscribe(channel: str, ch: _Channel, q: asyncio.Queue):
+    ch.subs.discard(q)
+    if not ch.subs:
+        if ch.history:
+            ch.idle_since = time.monotonic()  # keep it around for reconnects
+        elif _channels.get(channel) is ch:
+            del _channels[channel]
+
+def _replay(ch: _Channel, last_id: Optional[str]) -> list[str]:
+    if not last_id:
+        return []
+    try:
+        last = int(last_id)
+    except ValueError:
+        return []
+    return [frame for seq, frame in ch.history if seq > last]
+
+async def _publisher(channel: str, last_id: Optional[str] = None):
+    ch, q = _subscribe(channel)
+    heartbeat = _config["heartbeat"]
+    try:
+        for frame in _replay(ch, last_id):
+            yield frame
+        while True:
+            try:
+                frame = await asyncio.wait_for(q.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"; continue
+            if frame is _CLOSE:
+                return
+            yield frame
+    finally:
+        _unsubscribe(channel, ch, q)
+
+def stats() -> dict:
+    return {"broker": _broker.name, "channels": len(_channels),
+            "subscribers": sum(len(ch.subs) for ch in _channels.values()), **_stats}
 
 _router = APIRouter()
 
 @_router.get('/bx/sse')
-async def sse(to: str):
-    gen = _publisher(to)
-    return StreamingResponse(gen, media_type='text/event-stream')
+async def sse(to: str, request: Request):
+    gen = _publisher(to, request.headers.get('last-event-id'))
+    return StreamingResponse(gen, media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 def mount_sse(app):
     app.include_router(_router)
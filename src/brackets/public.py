@@ -3,6 +3,9 @@ from .internal.app import App, openWindow
 from .internal.http import page, json, redirect, toast, reload
 from .internal.router import get, post, put, delete
 from .internal.cache import cache, invalidate, useCache
+from .internal.sse import broadcast, useSSE
+from .internal.events import useEvents
+from .internal.limit import limit
 from .internal.data import (
-    Model, Data, Id, CreatedAt, UpdatedAt, useDatabase, resource, crud
+    Model, Data, Id, CreatedAt, UpdatedAt, useDatabase, resource, crud, DB, AsyncDB
 )
@@ -32,4 +32,27 @@
     a.dataset.prefetched = "1";
     fetch(a.getAttribute('href'), { headers: { 'HX-Request': 'true' } }).catch(()=>{});
   });
+
+  // Client events: buffered and posted to /bx/event as one JSON array.
+  // Brx.event('click', {id: 'buy'}) — flushed every 2s, at 50 events, and on page hide.
+  var queue = [], timer = null, MAX = 50, DELAY = 2000;
+  function flush(){
+    if(timer){ clearTimeout(timer); timer = null; }
+    if(!queue.length) return;
+    var body = JSON.stringify(queue.splice(0, queue.length));
+    var blob = new Blob([body], { type: 'application/json' });
+    if(!(navigator.sendBeacon && navigator.sendBeacon('/bx/event', blob))){
+      fetch('/bx/event', { method: 'POST', body: body, keepalive: true,
+                           headers: { 'Content-Type': 'application/json' } }).catch(()=>{});
+    }
+  }
+  function event(type, data){
+    var ev = Object.assign({ type: type, path: location.pathname, ts: Date.now() }, data || {});
+    queue.push(ev);
+    if(queue.length >= MAX) flush();
+    else if(!timer) timer = setTimeout(flush, DELAY);
+  }
+  document.addEventListener('visibilitychange', function(){ if(document.visibilityState === 'hidden') flush(); });
+  window.addEventListener('pagehide', flush);
+  window.Brx = Object.assign(window.Brx || {}, { event: event, flush: flush });
 })();
@@ -0,0 +1,56 @@
+"""Golden-file check for the .bx compiler.
+
+Every file in corpus/ is compiled with compile_bx and compared byte for byte
+with a golden file:
+
+- expected/<name>.jinja is the output of the old multi-pass compiler (the one
+  compile_bx replaced). The default, compat=True, must reproduce it exactly;
+  it is never rewritten from the current compiler.
+- expected_fixed/<name>.jinja is the output of compile_bx(..., compat=False),
+  the opt-in corrected compiler.
+
+    python tests/dsl_golden/check.py            # exit 1 and show a diff on any change
+    python tests/dsl_golden/check.py --update   # rewrite expected_fixed/ from the current compiler
+
+A change that is meant to alter the compat=False output updates expected_fixed/
+in the same commit, so the diff shows exactly what changed.
+"""
+from __future__ import annotations
+import difflib, sys
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parents[1] / 'src'))
+from brackets.internal.dsl import compile_bx  # noqa: E402
+
+MODES = {'expected': True, 'expected_fixed': False}  # golden dir -> compat
+
+def main(argv: list[str]) -> int:
+    update = '--update' in argv
+    sources = sorted((HERE / 'corpus').iterdir())
+    changed = 0
+    for dirname, compat in MODES.items():
+        expected = HERE / dirname
+        if update and compat:
+            continue
+        expected.mkdir(exist_ok=True)
+        for src in sources:
+            out = compile_bx(src.read_text(encoding='utf-8'), compat=compat)
+            golden = expected / f'{src.name}.jinja'
+            if update:
+                golden.write_text(out, encoding='utf-8'); continue
+            want = golden.read_text(encoding='utf-8') if golden.exists() else ''
+            if out != want:
+                changed += 1
+                sys.stdout.writelines(difflib.unified_diff(
+                    want.splitlines(True), out.splitlines(True), f'{dirname}/{golden.name}',
+                    f'compile_bx({src.name}, compat={compat})'))
+    total = len(sources)
+    if update:
+        print(f'[brx] wrote {total} golden file(s) to expected_fixed/')
+    else:
+        print(f'[brx] {2 * total - changed}/{2 * total} golden file(s) match')
+    return 1 if changed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
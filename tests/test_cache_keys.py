@@ -0,0 +1,31 @@
+import asyncio
+from starlette.requests import Request
+from brackets.internal import cache as c
+
+class User:
+    def __init__(self, id): self.id = id
+
+def setup_function():
+    c.useCache('memory')
+    c._mem.clear()
+
+def test_distinct_unkeyable_args_dont_collide():
+    @c.cache(60)
+    def name(user): return f'user-{user.id}'
+    assert name(User(1)) == 'user-1'
+    assert name(User(2)) == 'user-2'
+    assert len(c._mem) == 0  # not cached at all
+
+def test_distinct_unkeyable_args_dont_collide_async():
+    @c.cache(60)
+    async def name(user): return f'user-{user.id}'
+    assert asyncio.run(name(User(1))) == 'user-1'
+    assert asyncio.run(name(User(2))) == 'user-2'
+
+def test_framework_objects_are_left_out_of_the_key():
+    calls = []
+    @c.cache(60)
+    def page(request, n): calls.append(n); return n
+    req = lambda: Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': [], 'query_string': b''})
+    assert page(req(), 1) == 1 and page(req(), 1) == 1 and page(req(), 2) == 2
+    assert calls == [1, 2]
@@ -0,0 +1,42 @@
+import pickle, time
+import pytest
+from brackets.internal import cache as c
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')  # fakeredis runs the Lua scripts with it
+
+@pytest.fixture
+def cli(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(c.redis.Redis, 'from_url', classmethod(lambda cls, url, **kw: fakeredis.FakeRedis(server=server)))
+    monkeypatch.setattr(c.aredis.Redis, 'from_url', classmethod(lambda cls, url, **kw: fakeredis.aioredis.FakeRedis(server=server)))
+    c.useCache('redis://127.0.0.1:6379/0')
+    yield c._backend['client']
+    c.useCache('memory')
+
+def test_values_are_json_by_default(cli):
+    c._set('a', {'x': [1, 2]}, 60, None)
+    assert c._get('a')[1] == {'x': [1, 2]}
+    with pytest.raises(TypeError, match='serializer=pickle'):
+        c._set('b', object(), 60, None)
+
+def test_pickled_values_are_not_loaded_unless_opted_in(cli):
+    cli.set('brx:p', c._HEADER.pack(c._FORMAT, time.time() + 60) + pickle.dumps((1, 2)))
+    assert c._get('p') == (None, None)
+    c.useCache('redis://127.0.0.1:6379/0', serializer=pickle)
+    assert c._get('p')[1] == (1, 2)
+
+def test_tag_sets_expire_with_their_longest_lived_member(cli):
+    c._set('a', 1, 10, ['t'])
+    c._set('b', 1, 100, ['t'], stale=20)
+    assert 110 < cli.ttl('brx:tag:t') <= 121
+    c._set('c', 1, 0, ['t'])
+    assert cli.ttl('brx:tag:t') == -1  # a member that never expires keeps the set
+
+def test_invalidate_tag_drops_members_in_batches(cli, monkeypatch):
+    monkeypatch.setattr(c, '_TAG_BATCH', 2)
+    for i in range(5): c._set(f'k{i}', i, 60, ['many'])
+    c._set('other', 1, 60, ['keep'])
+    c.invalidate(tags=['many'])
+    assert cli.keys('brx:k*') == [] and not cli.exists('brx:tag:many')
+    assert c._get('other')[1] == 1
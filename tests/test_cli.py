@@ -0,0 +1,18 @@
+import sys
+from brackets.cli import _import_string
+
+def test_import_string_resolves_the_app_by_importing_the_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, 'path', list(sys.path))
+    (tmp_path / 'server_mod.py').write_text("from brackets.internal.app import App\napp = App()\n")
+    # no 'app = ...' line here: the App is re-exported, and 'api' is not an App
+    (tmp_path / 'entry_mod.py').write_text("api = {'version': 1}\nfrom server_mod import app as application\n")
+    try:
+        target, app_dir = _import_string(f"{tmp_path / 'entry_mod.py'}:app")
+        assert (target, app_dir) == ('entry_mod:application', str(tmp_path))
+        # uvicorn imports 'entry_mod' and gets the module loaded here, not a second copy
+        assert sys.modules['entry_mod'].application is sys.modules['server_mod'].app
+    finally:
+        sys.modules.pop('entry_mod', None); sys.modules.pop('server_mod', None)
+
+def test_import_string_leaves_module_targets_alone():
+    assert _import_string('pkg.mod:app') == ('pkg.mod:app', None)
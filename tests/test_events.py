@@ -0,0 +1,35 @@
+import asyncio, json
+import httpx
+from fastapi import FastAPI
+from brackets.internal import events
+
+def _post(**kw):
+    app = FastAPI(); events.mount_events(app)
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://t') as c:
+            return await c.post('/bx/event', **kw)
+    return asyncio.run(go())
+
+def setup_function():
+    events.useEvents(max_per_request=10, max_body=1024)
+
+def teardown_function():
+    events.useEvents()
+
+def test_batches_within_the_limits_are_accepted():
+    r = _post(json=[{'type': 'click'}] * 10)
+    assert r.status_code == 202 and r.json()['accepted'] == 10
+
+def test_too_many_events_is_413():
+    assert _post(json=[{'type': 'click'}] * 11).status_code == 413
+
+def test_oversized_body_is_413_with_or_without_content_length():
+    big = json.dumps([{'type': 'x' * 2000}]).encode()
+    assert _post(content=big, headers={'content-type': 'application/json'}).status_code == 413
+    async def chunks():
+        for i in range(0, len(big), 100): yield big[i:i + 100]
+    assert _post(content=chunks(), headers={'content-type': 'application/json'}).status_code == 413
+
+def test_form_encoded_event_still_works():
+    r = _post(data={'type': 'click'})
+    assert r.status_code == 202 and r.json()['accepted'] == 1
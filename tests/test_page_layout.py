@@ -0,0 +1,47 @@
+import asyncio
+from starlette.requests import Request
+from brackets.internal.app import App
+from brackets.internal.http import page
+
+def _app(tmp_path, **kw):
+    (tmp_path / 'layouts').mkdir()
+    (tmp_path / 'layouts' / '@base.bx').write_text('<main>{children}</main>')
+    (tmp_path / 'page.html').write_text('<!doctype html><p>{{ n }}</p>')
+    return App(templates=str(tmp_path), **kw)
+
+def _req():
+    return Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': [], 'query_string': b''})
+
+def test_pages_are_not_wrapped_unless_a_layout_is_named(tmp_path):
+    app = _app(tmp_path)
+    assert page('page.html', n=1, _app=app, _request=_req()).body == b'<!doctype html><p>1</p>'
+    wrapped = page('page.html', n=1, _app=app, _request=_req(), _layout='layouts/@base.bx')
+    assert wrapped.body == b'<main><!doctype html><p>1</p></main>'
+
+def test_app_layout_wraps_every_page(tmp_path):
+    app = _app(tmp_path, layout='layouts/@base.bx')
+    assert page('page.html', n=1, _app=app, _request=_req()).body == b'<main><!doctype html><p>1</p></main>'
+    assert page('page.html', n=1, _app=app, _request=_req(), _layout=None).body == b'<!doctype html><p>1</p>'
+
+def test_missing_layout_lookups_are_cached(tmp_path, monkeypatch):
+    app = _app(tmp_path)
+    app.env.jinja.auto_reload = False
+    assert not app.env.has_template('layouts/nope.bx')
+    calls = []
+    monkeypatch.setattr(app.env.loader, 'get_source', lambda *a: calls.append(a))
+    assert not app.env.has_template('layouts/nope.bx')
+    assert calls == []
+
+def _streamed(resp):
+    async def read(): return ''.join([c async for c in resp.body_iterator])
+    return asyncio.run(read())
+
+def test_streamed_page_fills_the_layout_slot(tmp_path):
+    app = _app(tmp_path, layout='layouts/@base.bx')
+    assert _streamed(page('page.html', n=1, _app=app, _request=_req(), _stream=True)) == '<main><!doctype html><p>1</p></main>'
+
+def test_streamed_page_without_a_children_slot_renders_like_a_normal_page(tmp_path):
+    app = _app(tmp_path)
+    (tmp_path / 'layouts' / 'bare.bx').write_text('<html><body></body></html>')
+    kw = dict(n=1, _app=app, _request=_req(), _layout='layouts/bare.bx')
+    assert _streamed(page('page.html', _stream=True, **kw)) == page('page.html', **kw).body.decode()